@@ -1,17 +1,84 @@
 # backend/app.py
 
+import asyncio
+import inspect
+import json
+import logging
 import os
+import secrets
 import tempfile
-from typing import Optional
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
 
+import numpy as np
 import pandas as pd
-from fastapi import FastAPI, UploadFile, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from pydantic import BaseModel
-from extract_features import extract_heuristic_features_from_audio
-from normalize_output import normalize_song_features
+from audio_io import DecodeError, encode_wav, synthetic_clip
+from extract_features import QUALITY_TIERS
+from feature_cache import FeatureCache, content_key
+from feature_io import (
+    ARROW_STREAM_TYPE, NDJSON_TYPES, ArrowResultWriter, iter_arrow, iter_ndjson, ndjson_results,
+)
+from forest_engine import compile_forest
+from job_store import JobStore
+import metrics
+from model_bundle import (
+    BUNDLES_DIR, GOLDEN_FEATURES, GOLDEN_TOL, BundleError, ModelBundle, current_bundle_path, model_key,
+)
+from normalize_output import FEATURE_ORDER, MODELS_DIR
+from shadow import ShadowScorer
+from workers import ExtractionPool, QueueFullError, extract_job, extract_variant
 # ------------------------- FastAPI app -------------------------
-app = FastAPI(title="Song Popularity Predictor")
+EXTRACTION_POOL = ExtractionPool()
+metrics.track_pool(EXTRACTION_POOL)
+FEATURE_CACHE = FeatureCache()
+_IN_FLIGHT: dict = {}  # content key -> Future of an extraction already running
+
+# Startup warm-up progress, reported by /ready
+WARMUP_STATE = {"ready": False, "error": None, "model_version": None, "timings_ms": {}}
+_WARMUP_TASK: Optional[asyncio.Task] = None
+
+# Asynchronous /jobs: persistent state, a FIFO of job ids waiting for one
+# of JOB_RUNNERS runner tasks, the queue length past which POST /jobs is
+# turned away, and how often the SSE stream polls the store. Uploads stay
+# on disk until a runner takes the job.
+JOB_STORE = JobStore()
+JOB_QUEUE: asyncio.Queue = asyncio.Queue()
+metrics.JOBS_QUEUED.set_function(JOB_QUEUE.qsize)
+_JOB_RUNNERS: List[asyncio.Task] = []
+JOB_RUNNERS = int(os.environ.get("JOB_RUNNERS", EXTRACTION_POOL.max_workers))
+JOB_MAX_QUEUED = int(os.environ.get("JOB_MAX_QUEUED", 256))
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", 0.5))
+JOB_KEEPALIVE_SECONDS = 15.0
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background so "/" answers liveness probes meanwhile;
+    # requests that arrive early wait for it (see ensure_ready)
+    global _WARMUP_TASK
+    _WARMUP_TASK = asyncio.create_task(warm_up())
+    watcher = asyncio.create_task(watch_models()) if MODEL_WATCH_SECONDS > 0 else None
+    # Jobs left queued/running by a previous process start over, oldest first
+    await run_in_threadpool(JOB_STORE.purge_expired)
+    for job_id in await run_in_threadpool(JOB_STORE.unfinished):
+        start_job(job_id)
+    _JOB_RUNNERS[:] = [asyncio.create_task(job_runner()) for _ in range(max(1, JOB_RUNNERS))]
+    yield
+    _WARMUP_TASK.cancel()
+    if watcher is not None:
+        watcher.cancel()
+    for task in _JOB_RUNNERS:
+        task.cancel()
+    EXTRACTION_POOL.shutdown()
+    SHADOW.shutdown()
+
+app = FastAPI(title="Song Popularity Predictor", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,20 +87,57 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def track_predictions(request: Request, call_next):
+    """In-flight gauge and end-to-end latency for the /predict* endpoints."""
+    if not request.url.path.startswith("/predict"):
+        return await call_next(request)
+    metrics.REQUESTS_IN_FLIGHT.inc()
+    t0 = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        metrics.REQUESTS_IN_FLIGHT.dec()
+        # Label by route template, so unknown paths can't add label values
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        metrics.REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - t0)
+
 # ------------------------- ML Artifacts -------------------------
-MODEL = None
-SCALER = None
-GENRE_ENCODER = None
-
-MODEL_PATH = os.path.join(os.path.dirname(__file__), "models", "random_forest.joblib")
-SCALER_PATH = os.path.join(os.path.dirname(__file__), "models", "scaler.joblib")
-GENRE_ENCODER_PATH = os.path.join(os.path.dirname(__file__), "models", "track_genre_encoder.joblib")
-
-FEATURE_ORDER = [
-    "duration_ms", "explicit", "danceability", "key", "loudness", "mode",
-    "speechiness", "acousticness", "instrumentalness", "liveness", "valence",
-    "tempo", "time_signature", "track_genre"
-]
+# The served model as one ModelState snapshot. Handlers read MODEL_STATE
+# once (see ensure_ready) and use that snapshot throughout, so a reload,
+# which replaces the reference in one assignment, never mixes versions
+# within a request.
+MODEL_STATE = None
+_RELOAD_LOCK = asyncio.Lock()
+
+# Seconds between checks of models/bundles/CURRENT (0 disables the
+# watcher), and the token /admin/reload requires (unset disables it)
+MODEL_WATCH_SECONDS = float(os.environ.get("MODEL_WATCH_SECONDS", 10))
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+# Other models from registry.json, by key ("random_forest", "hist_gradient_boosting", ...).
+# SERVE_MODELS ("all" or a comma-separated list) can be picked per request
+# with the ``model`` form field; SHADOW_MODELS also score every default-model
+# request in the background (see shadow.py) so their disagreement is logged.
+MODEL_REGISTRY = os.environ.get("MODEL_REGISTRY", os.path.join(MODELS_DIR, "registry.json"))
+SERVE_MODELS = [k.strip() for k in os.environ.get("SERVE_MODELS", "").split(",") if k.strip()]
+SHADOW_MODELS = [k.strip() for k in os.environ.get("SHADOW_MODELS", "").split(",") if k.strip()]
+SHADOW = ShadowScorer()
+
+# "flat" scores with forest_engine when the model is a tree ensemble;
+# "sklearn" always calls the estimator's predict. The flat walk wins for small inputs; past
+# FOREST_FLAT_MAX_ROWS rows sklearn's Cython loop is faster.
+FOREST_ENGINE = os.environ.get("FOREST_ENGINE", "flat")
+FOREST_FLAT_MAX_ROWS = int(os.environ.get("FOREST_FLAT_MAX_ROWS", 256))
+FOREST_PARITY_TOL = 1e-9
+
+logger = logging.getLogger(__name__)
+
+# Standalone artifacts, used when there is no model bundle (see model_bundle)
+MODEL_PATH = os.path.join(MODELS_DIR, "random_forest.joblib")
+SCALER_PATH = os.path.join(MODELS_DIR, "scaler.joblib")
+GENRE_ENCODER_PATH = os.path.join(MODELS_DIR, "track_genre_encoder.joblib")
 
 GENRES = [
     "acoustic","afrobeat","alt-rock","alternative","ambient","anime","black-metal",
@@ -51,97 +155,862 @@ GENRES = [
     "tango","techno","trance","trip-hop","turkish","world-music"
 ]
 
+ALLOWED_EXTENSIONS = {'.wav', '.mp3', '.m4a', '.flac', '.aac', '.ogg', '.wma'}
+
+# Extraction tier used when /predict_file is not given one (see QUALITY_TIERS)
+DEFAULT_QUALITY = os.environ.get("DEFAULT_QUALITY", "full")
+
+# Upper bound on files accepted by one /predict_batch call
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", 256))
+
+# Bulk /predict_features bodies are spooled to disk past this size
+FEATURES_SPOOL_BYTES = int(os.environ.get("FEATURES_SPOOL_BYTES", 16 * 1024 * 1024))
+
 # ------------------------- Schemas -------------------------
 class PredictResponse(BaseModel):
     popularity: float
     popularity_rounded: int
+    quality: str = "full"
+    excerpts: bool = False
+    model_version: Optional[str] = None
+    model: Optional[str] = None
+
+class GenreScore(BaseModel):
+    track_genre: str
+    popularity: float
+    popularity_rounded: int
+
+class AllGenresResponse(BaseModel):
+    best: GenreScore
+    ranking: List[GenreScore]
+    model_version: str
+    model: str
+
+class BatchItem(BaseModel):
+    filename: str
+    track_genre: str
+    popularity: Optional[float] = None
+    popularity_rounded: Optional[int] = None
+    error: Optional[str] = None
+
+class BatchPredictResponse(BaseModel):
+    results: List[BatchItem]
+    succeeded: int
+    failed: int
+    model_version: str
+    model: str
+
+class FeaturePrediction(BaseModel):
+    popularity: float
+    popularity_rounded: int
+    model_version: str
+    model: str
+
+class JobStatus(BaseModel):
+    id: str
+    status: str          # queued | running | done | failed
+    stage: str           # queued | received | decoded | features | predicted
+    progress: float      # 0..1
+    filename: str
+    track_genre: str
+    quality: str
+    excerpts: bool
+    result: Optional[PredictResponse] = None
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
 
 # ------------------------- Helper Functions -------------------------
-def lazy_load_models():
-    """Load ML artifacts only on first request."""
-    global MODEL, SCALER, GENRE_ENCODER
-    if MODEL is None:
-        import joblib
-        if not os.path.exists(MODEL_PATH):
-            raise RuntimeError(f"Model not found: {MODEL_PATH}")
-        if not os.path.exists(SCALER_PATH):
-            raise RuntimeError(f"Scaler not found: {SCALER_PATH}")
-        if not os.path.exists(GENRE_ENCODER_PATH):
-            raise RuntimeError(f"Genre encoder not found: {GENRE_ENCODER_PATH}")
-
-        MODEL = joblib.load(MODEL_PATH)
-        SCALER = joblib.load(SCALER_PATH)
-        GENRE_ENCODER = joblib.load(GENRE_ENCODER_PATH)
-
-def convert_to_wav(input_path: str, output_path: str) -> None:
-    """Convert any audio file to WAV using librosa."""
-    import librosa
-    import soundfile as sf
-    y, sr = librosa.load(input_path, sr=22050)
-    sf.write(output_path, y, sr, subtype='PCM_16')
+class ModelState:
+    """
+    A loaded bundle plus the engine chosen for it; immutable once built.
+    The served state also carries the registry models that load with it
+    (``others`` for routing, ``shadows`` for shadow scoring), so a reload
+    swaps them all together.
+    """
 
+    def __init__(self, bundle: ModelBundle, source: Optional[str], flat=None):
+        self.bundle = bundle
+        self.source = source  # bundle directory, None for standalone joblib files
+        self.normalizer = bundle.normalizer
+        self.flat = flat      # flat copy of the model for low-overhead scoring, if supported
+        self.others: Dict[str, "ModelState"] = {}
+        self.shadows: List["ModelState"] = []
 
-# ------------------------- Endpoints -------------------------
-@app.get("/")
-def health_check():
-    return {"status": "ok"}
+    @property
+    def name(self) -> str:
+        return self.bundle.name
 
-@app.post("/predict_file", response_model=PredictResponse)
-async def predict_file(file: UploadFile, track_genre: str = Form(...)):
-    lazy_load_models()
+    @property
+    def version(self) -> str:
+        return self.bundle.version
 
-    # Validate genre
+    @property
+    def available(self) -> List[str]:
+        return [self.name] + sorted(self.others)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        if self.flat is not None and len(X) <= FOREST_FLAT_MAX_ROWS:
+            return self.flat.predict(X)
+        return self.bundle.model.predict(pd.DataFrame(X, columns=FEATURE_ORDER))
+
+def open_bundle(path: Optional[str] = None) -> ModelBundle:
+    """The bundle at ``path``; by default the current one, or the standalone
+    joblib files if no bundle has been built."""
+    if path is not None:
+        return ModelBundle.load(path)
+    for path in (MODEL_PATH, SCALER_PATH, GENRE_ENCODER_PATH):
+        if not os.path.exists(path):
+            raise RuntimeError(f"Model artifact not found: {path}")
+    return ModelBundle.from_joblib(MODEL_PATH, SCALER_PATH, GENRE_ENCODER_PATH)
+
+def build_state(bundle: ModelBundle, source: Optional[str]) -> ModelState:
+    if FOREST_ENGINE != "flat":
+        flat = None
+    elif bundle.flat is not None:
+        # Memory-mapped, and checked for parity when the bundle was written
+        flat = bundle.flat
+    else:
+        flat = load_flat_forest(bundle.model)
+    return ModelState(bundle, source, flat)
+
+def validate_state(state: ModelState) -> None:
+    """Score the bundle's golden vector; ValueError unless it reproduces the
+    recorded prediction (or, for unbundled models, is at least finite)."""
+    golden = state.bundle.manifest.get("golden")
+    features = golden["features"] if golden else GOLDEN_FEATURES
+    pred = float(state.predict(state.normalizer.transform(state.normalizer.to_matrix([features])))[0])
+    if not np.isfinite(pred):
+        raise ValueError(f"Model {state.version} scores the golden vector as {pred}")
+    if golden and abs(pred - golden["prediction"]) > GOLDEN_TOL:
+        raise ValueError(
+            f"Model {state.version} scores the golden vector {pred}, bundle recorded {golden['prediction']}"
+        )
+
+def read_registry() -> Dict[str, dict]:
+    """registry.json entries by model key; empty if there is no registry."""
+    try:
+        with open(MODEL_REGISTRY) as f:
+            entries = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return {model_key(e["model_name"]): e for e in entries}
+
+def load_registry_model(entry: dict, reuse: Dict[str, ModelState]) -> ModelState:
+    """A registry entry as a validated ModelState, from its bundle if it has one."""
+    if entry.get("bundle"):
+        path = os.path.join(BUNDLES_DIR, entry["bundle"])
+        if path in reuse:
+            return reuse[path]
+        state = build_state(ModelBundle.load(path), path)
+    else:
+        models_dir = os.path.dirname(MODEL_REGISTRY)
+        bundle = ModelBundle.from_joblib(
+            os.path.join(models_dir, entry["file"]),
+            os.path.join(models_dir, "scaler.joblib"),
+            os.path.join(models_dir, "track_genre_encoder.joblib"),
+        )
+        state = build_state(bundle, None)
+    validate_state(state)
+    return state
+
+def attach_registry_models(state: ModelState, previous: Optional[ModelState] = None) -> None:
+    """
+    Load SERVE_MODELS and SHADOW_MODELS from the registry into ``state``.
+    Models that are missing or fail to load are skipped with a warning;
+    bundles ``previous`` already had loaded are reused. Shadows score the
+    served model's normalized rows, so they must share its encoding.
+    """
+    if not SERVE_MODELS and not SHADOW_MODELS:
+        return
+    entries = read_registry()
+    serve = list(entries) if "all" in SERVE_MODELS else SERVE_MODELS
+    reuse = {}
+    if previous is not None:
+        reuse = {s.source: s for s in list(previous.others.values()) + previous.shadows if s.source}
+
+    loaded = {}
+    for key in dict.fromkeys(serve + SHADOW_MODELS):
+        if key == state.name:
+            continue
+        if key not in entries:
+            logger.warning("Model %s is not in %s; skipping it", key, MODEL_REGISTRY)
+            continue
+        try:
+            loaded[key] = load_registry_model(entries[key], reuse)
+        except Exception as e:
+            logger.warning("Could not load model %s; skipping it: %s", key, e)
+
+    state.others = {k: loaded[k] for k in serve if k in loaded}
+    for key in SHADOW_MODELS:
+        if key not in loaded:
+            continue
+        if not loaded[key].normalizer.same_encoding(state.normalizer):
+            logger.warning("Shadow model %s was trained on another encoding than %s; skipping it",
+                           key, state.name)
+            continue
+        state.shadows.append(loaded[key])
+
+def load_state(path: Optional[str] = None, previous: Optional[ModelState] = None) -> ModelState:
+    """Load, compile and validate a model without touching MODEL_STATE."""
+    state = build_state(open_bundle(path), path)
+    validate_state(state)
+    attach_registry_models(state, previous)
+    return state
+
+async def reload_model(path: Optional[str] = None) -> ModelState:
+    """
+    Load the bundle at ``path`` (default: the current one) in a worker thread
+    and, once it validates, make it the served model. Requests that already
+    hold the old snapshot finish on it; on failure the old model stays.
+    """
+    global MODEL_STATE
+    async with _RELOAD_LOCK:
+        try:
+            state = await run_in_threadpool(load_state, path or current_bundle_path(), MODEL_STATE)
+        except Exception:
+            metrics.MODEL_RELOADS.labels("failed").inc()
+            raise
+        previous, MODEL_STATE = MODEL_STATE, state
+        metrics.MODEL_RELOADS.labels("ok").inc()
+        metrics.MODEL_INFO.info({"version": state.version, "class": state.bundle.manifest["model"]["class"]})
+        logger.info("Serving model %s (was %s)", state.version, previous.version if previous else None)
+        return state
+
+async def watch_models():
+    """Reload whenever models/bundles/CURRENT starts naming another bundle."""
+    try:
+        await asyncio.shield(_WARMUP_TASK)
+    except Exception:
+        return
+    seen = MODEL_STATE.source
+    while True:
+        await asyncio.sleep(MODEL_WATCH_SECONDS)
+        path = await run_in_threadpool(current_bundle_path)
+        if path is None or path == seen:
+            continue
+        seen = path
+        try:
+            await reload_model(path)
+        except Exception as e:
+            logger.warning("Model reload from %s failed, still serving %s: %s",
+                           path, MODEL_STATE.version, e)
+
+def load_flat_forest(model):
+    """Compile ``model`` for flat inference; None if unsupported or not at parity."""
+    try:
+        flat = compile_forest(model)
+    except TypeError as e:
+        logger.info("Flat forest engine disabled: %s", e)
+        return None
+    probe = pd.DataFrame(
+        np.random.default_rng(0).normal(size=(256, len(FEATURE_ORDER))), columns=FEATURE_ORDER
+    )
+    gap = flat.max_abs_diff(model, probe)
+    if gap > FOREST_PARITY_TOL:
+        logger.warning("Flat forest engine disabled: differs from sklearn by %g", gap)
+        return None
+    return flat
+
+def normalize_rows(state: ModelState, rows: List[dict]) -> np.ndarray:
+    """Raw feature dicts -> normalized model input (N, 14)."""
+    with metrics.STAGE_SECONDS.labels("normalize").time():
+        return state.normalizer.transform(state.normalizer.to_matrix(rows))
+
+def predict_matrix(state: ModelState, X: np.ndarray) -> np.ndarray:
+    """Score normalized rows (N, 14) in FEATURE_ORDER, clipped to 0..100."""
+    with metrics.STAGE_SECONDS.labels("predict").time():
+        pred = state.predict(X)
+    return np.clip(pred, 0.0, 100.0)
+
+def route_model(state: ModelState, model: Optional[str]) -> ModelState:
+    """The model a request asked for (default: the served one); 400 if it isn't loaded."""
+    if model is None or model_key(model) == state.name:
+        return state
+    try:
+        return state.others[model_key(model)]
+    except KeyError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown model: {model}. Available: {', '.join(state.available)}",
+        )
+
+async def score(state: ModelState, scorer: ModelState, X: np.ndarray) -> np.ndarray:
+    """
+    ``predict_matrix`` with ``scorer``, the model routed to from the served
+    ``state``. Requests on the served model also queue its shadows, which
+    run after the response and never delay it.
+    """
+    preds = await run_in_threadpool(predict_matrix, scorer, X)
+    if scorer is state:
+        SHADOW.submit(X, preds, state.name, state.shadows)
+    return preds
+
+def score_feature_chunk(scorer: ModelState, columns) -> np.ndarray:
+    """Score one bulk /predict_features chunk; NaN for rows with non-numeric features."""
+    with metrics.STAGE_SECONDS.labels("normalize").time():
+        X = scorer.normalizer.transform(scorer.normalizer.columns_to_matrix(columns))
+    preds = np.full(len(X), np.nan)
+    valid = np.isfinite(X).all(axis=1)
+    if valid.any():
+        preds[valid] = predict_matrix(scorer, X[valid])
+    return preds
+
+def next_feature_chunk(scorer: ModelState, chunks) -> Optional[np.ndarray]:
+    columns = next(chunks, None)
+    return None if columns is None else score_feature_chunk(scorer, columns)
+
+async def spool_body(request: Request):
+    """The request body as a file, in memory up to FEATURES_SPOOL_BYTES, then on disk."""
+    body = tempfile.SpooledTemporaryFile(max_size=FEATURES_SPOOL_BYTES)
+    async for chunk in request.stream():
+        body.write(chunk)
+    body.seek(0)
+    return body
+
+async def read_upload(upload: UploadFile) -> bytes:
+    with metrics.STAGE_SECONDS.labels("read").time():
+        return await upload.read()
+
+async def warm_up():
+    """
+    Load every artifact and push a synthetic clip through the full
+    decode -> extract -> normalize -> predict path, timing each step.
+    Workers start first so they fork before the model is in memory.
+    """
+    timings = WARMUP_STATE["timings_ms"]
+
+    async def step(name, fn, *args):
+        t0 = time.perf_counter()
+        result = await fn(*args) if inspect.iscoroutinefunction(fn) else await run_in_threadpool(fn, *args)
+        timings[name] = round((time.perf_counter() - t0) * 1000.0, 1)
+        return result
+
+    global MODEL_STATE
+    try:
+        await step("start_workers", EXTRACTION_POOL.start)
+        source = current_bundle_path()
+        bundle = await step("load_artifacts", open_bundle, source)
+        state = await step("compile_model", build_state, bundle, source)
+        await step("validate_model", validate_state, state)
+        await step("load_registry_models", attach_registry_models, state)
+        clip = await step("encode_clip", lambda: encode_wav(synthetic_clip(5.0)))
+        feats, _ = await step("extract", EXTRACTION_POOL.run, extract_job, clip, ".wav")
+        feats["track_genre"] = GENRES[0]
+        X = await step("normalize", normalize_rows, state, [feats])
+        await step("predict", predict_matrix, state, X)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        WARMUP_STATE["error"] = f"{type(e).__name__}: {e}"
+        logger.exception("Startup warm-up failed")
+        raise
+    timings["total"] = round(sum(timings.values()), 1)
+    MODEL_STATE = state
+    metrics.MODEL_INFO.info({"version": state.version, "class": bundle.manifest["model"]["class"]})
+    WARMUP_STATE["model_version"] = state.version
+    WARMUP_STATE["ready"] = True
+
+async def ensure_ready() -> ModelState:
+    """Wait for startup warm-up (503 if it failed); returns the model
+    snapshot the caller should use for the rest of the request."""
+    if WARMUP_STATE["ready"]:
+        return MODEL_STATE
+    try:
+        await asyncio.shield(_WARMUP_TASK)
+    except Exception:
+        raise HTTPException(status_code=503, detail=f"Warm-up failed: {WARMUP_STATE['error']}")
+    return MODEL_STATE
+
+def validate_options(track_genre: str, quality: str) -> None:
+    """HTTP 400 for an unknown genre or quality tier."""
     if track_genre not in GENRES:
         raise HTTPException(status_code=400, detail=f"Unknown genre: {track_genre}")
+    if quality not in QUALITY_TIERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown quality: {quality}. Allowed: {', '.join(QUALITY_TIERS)}"
+        )
 
-    # Validate file extension
-    allowed_extensions = {'.wav', '.mp3', '.m4a', '.flac', '.aac', '.ogg', '.wma'}
-    ext = os.path.splitext(file.filename)[1].lower()
-    if ext not in allowed_extensions:
+def file_extension(filename: str) -> str:
+    """Lower-cased extension of an upload, or HTTP 400 if it is not audio we accept."""
+    ext = os.path.splitext(filename or "")[1].lower()
+    metrics.UPLOADS.labels(ext if ext in ALLOWED_EXTENSIONS else "unsupported").inc()
+    if ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(
             status_code=400,
-            detail=f"Unsupported file type. Allowed: {', '.join(allowed_extensions)}"
+            detail=f"Unsupported file type. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
+        )
+    return ext
+
+async def extract_features_cached(
+    file_bytes: bytes, ext: str, track_genre: str, quality: str = "full", excerpts: bool = False,
+    job_id: Optional[str] = None, wait: bool = False,
+) -> dict:
+    """
+    Raw features for an upload. Extraction does not depend on genre, so
+    results are cached by content hash and identical uploads that arrive
+    together share one extraction. ``job_id`` lets the worker report the
+    "decoded" stage of a /jobs upload; ``wait`` queues for a worker
+    instead of raising QueueFullError.
+    """
+    key = await run_in_threadpool(content_key, file_bytes, extract_variant(quality, excerpts))
+    feats = await run_in_threadpool(FEATURE_CACHE.get, key)
+    if feats is None:
+        pending = _IN_FLIGHT.get(key)
+        if pending is not None:
+            metrics.EXTRACTIONS.labels("shared").inc()
+            feats = dict(await asyncio.shield(pending))
+        else:
+            pending = asyncio.get_running_loop().create_future()
+            _IN_FLIGHT[key] = pending
+            try:
+                feats, timings = await EXTRACTION_POOL.run(
+                    extract_job, file_bytes, ext, quality, excerpts, job_id, wait=wait
+                )
+                pending.set_result(feats)
+            except BaseException as e:
+                if isinstance(e, QueueFullError):
+                    metrics.REJECTED.inc()
+                pending.set_exception(e)
+                pending.exception()  # consumed here, so no "never retrieved" warning
+                raise
+            finally:
+                del _IN_FLIGHT[key]
+            metrics.EXTRACTIONS.labels("extracted").inc()
+            metrics.observe_stages(timings)
+            await run_in_threadpool(FEATURE_CACHE.put, key, feats)
+            feats = dict(feats)
+    else:
+        metrics.EXTRACTIONS.labels("cache").inc()
+    feats["track_genre"] = track_genre
+    return feats
+
+
+def start_job(job_id: str) -> None:
+    JOB_QUEUE.put_nowait(job_id)
+
+async def job_runner() -> None:
+    """Take jobs off JOB_QUEUE one at a time, in submission order."""
+    while True:
+        job_id = await JOB_QUEUE.get()
+        try:
+            await run_job(job_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Job runner failed on job %s", job_id)
+
+async def run_job(job_id: str) -> None:
+    """
+    Process one /jobs upload, recording each stage in JOB_STORE. The upload
+    is only read once a runner has taken the job, and the job then waits
+    for a free worker instead of being turned away; a job cancelled by
+    shutdown stays "running" and is resumed on the next start.
+    """
+    job = await run_in_threadpool(JOB_STORE.get, job_id)
+    if job is None:
+        return
+    try:
+        state = await ensure_ready()
+        file_bytes = await run_in_threadpool(JOB_STORE.read_upload, job_id, job["ext"])
+        await run_in_threadpool(JOB_STORE.set_stage, job_id, "received")
+        feats = await extract_features_cached(
+            file_bytes, job["ext"], job["track_genre"], job["quality"], job["excerpts"], job_id,
+            wait=True,
+        )
+        await run_in_threadpool(JOB_STORE.set_stage, job_id, "features")
+
+        X = normalize_rows(state, [feats])
+        popularity = float((await score(state, state, X))[0])
+        metrics.PREDICTIONS.labels(job["track_genre"]).inc()
+        result = PredictResponse(
+            popularity=popularity,
+            popularity_rounded=int(round(popularity)),
+            quality=job["quality"],
+            excerpts=job["excerpts"],
+            model_version=state.version,
+            model=state.name,
         )
+        await run_in_threadpool(JOB_STORE.finish, job_id, result.model_dump())
+    except asyncio.CancelledError:
+        raise
+    except HTTPException as e:
+        await run_in_threadpool(JOB_STORE.fail, job_id, str(e.detail))
+    except Exception as e:
+        error = prediction_error(e).detail
+        logger.warning("Job %s failed: %s", job_id, error)
+        await run_in_threadpool(JOB_STORE.fail, job_id, error)
+
+def prediction_error(e: Exception) -> HTTPException:
+    """422 for uploads no decoder can read (the client's fault), 500 for anything else."""
+    if isinstance(e, DecodeError):
+        return HTTPException(status_code=422, detail=str(e))
+    return HTTPException(status_code=500, detail=f"Prediction error: {str(e) or type(e).__name__}")
+
+async def get_job_or_404(job_id: str) -> JobStatus:
+    job = await run_in_threadpool(JOB_STORE.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return JobStatus(**job)
+
+# ------------------------- Endpoints -------------------------
+@app.get("/")
+def health_check():
+    return {"status": "ok"}
 
-    # Save uploaded file
-    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp_input:
-        tmp_input.write(await file.read())
-        input_path = tmp_input.name
+@app.get("/ready")
+def readiness():
+    """
+    200 once warm-up finished, 503 before that, if it failed, or while the
+    extraction pool is restarting after a worker died; all carry step timings.
+    """
+    pool = {"healthy": EXTRACTION_POOL.healthy, "restarts": EXTRACTION_POOL.restarts}
+    status = 200 if WARMUP_STATE["ready"] and EXTRACTION_POOL.healthy else 503
+    return JSONResponse(status_code=status, content={**WARMUP_STATE, "extraction_pool": pool})
 
-    # Convert to WAV if needed
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_wav:
-        wav_path = tmp_wav.name
+@app.get("/cache/stats")
+def cache_stats():
+    return FEATURE_CACHE.stats()
 
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/model")
+def model_info():
+    """The model being served: version, class and training metadata."""
+    if MODEL_STATE is None:
+        raise HTTPException(status_code=503, detail="Model not loaded yet")
+    manifest = MODEL_STATE.bundle.manifest
+    return {"model_version": MODEL_STATE.version, "model": manifest["model"],
+            "engine": "flat" if MODEL_STATE.flat is not None else "sklearn",
+            "available": {s.name: s.version for s in [MODEL_STATE, *MODEL_STATE.others.values()]},
+            "shadows": {s.name: s.version for s in MODEL_STATE.shadows}}
+
+@app.get("/shadow/stats")
+def shadow_stats():
+    """Running disagreement of each shadow model with the model it shadowed."""
+    return SHADOW.stats()
+
+@app.post("/admin/reload")
+async def admin_reload(version: Optional[str] = None, x_admin_token: str = Header("")):
+    """
+    Load a bundle in the background and swap it in once it validates:
+    ``version`` names a directory under models/bundles, default is the one
+    CURRENT names. Requires an X-Admin-Token header equal to ADMIN_TOKEN.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API disabled (ADMIN_TOKEN is not set)")
+    if not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+    await ensure_ready()
+    path = None
+    if version is not None:
+        if version != os.path.basename(version) or version.startswith("."):
+            raise HTTPException(status_code=400, detail=f"Invalid bundle version: {version}")
+        path = os.path.join(BUNDLES_DIR, version)
+
+    previous = MODEL_STATE.version
+    t0 = time.perf_counter()
     try:
-        audio_path = wav_path if ext != ".wav" else input_path
-        if ext != ".wav":
-            convert_to_wav(input_path, wav_path)
+        state = await reload_model(path)
+    except (BundleError, ValueError, OSError) as e:
+        raise HTTPException(status_code=422, detail=f"Reload failed, still serving {previous}: {e}")
+    return {
+        "model_version": state.version,
+        "previous_version": previous,
+        "reload_ms": round((time.perf_counter() - t0) * 1000.0, 1),
+    }
 
-        with open(audio_path, "rb") as f:
-            feats = extract_heuristic_features_from_audio(f.read(), track_genre=track_genre)
+@app.post("/predict_file", response_model=PredictResponse)
+async def predict_file(
+    file: UploadFile,
+    track_genre: str = Form(...),
+    quality: str = Form(DEFAULT_QUALITY),
+    excerpts: bool = Form(False),
+    model: Optional[str] = Form(None),
+):
+    """
+    ``excerpts=true`` analyzes a few representative windows of long tracks
+    instead of the whole file (see excerpt_features). ``model`` picks one
+    of the loaded registry models (see GET /model) instead of the default.
+    """
+    state = await ensure_ready()
+    scorer = route_model(state, model)
+    validate_options(track_genre, quality)
+
+    # Validate file extension
+    ext = file_extension(file.filename)
 
-        norm_feats = normalize_song_features(feats)
-        X = pd.DataFrame([norm_feats], columns=FEATURE_ORDER)
+    file_bytes = await read_upload(file)
 
-        pred = MODEL.predict(X)
-        popularity = float(pred[0])
-        popularity = max(0.0, min(100.0, popularity))
+    try:
+        # Decode + extract in a worker process; the event loop only does I/O
+        feats = await extract_features_cached(file_bytes, ext, track_genre, quality, excerpts)
+
+        X = normalize_rows(scorer, [feats])
+        popularity = float((await score(state, scorer, X))[0])
+        metrics.PREDICTIONS.labels(track_genre).inc()
 
         return PredictResponse(
             popularity=popularity,
-            popularity_rounded=int(round(popularity))
+            popularity_rounded=int(round(popularity)),
+            quality=quality,
+            excerpts=excerpts,
+            model_version=scorer.version,
+            model=scorer.name,
         )
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=f"Server busy: {e}", headers={"Retry-After": "5"})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Prediction error: {e}")
-    finally:
-        # Cleanup temporary files
-        try: os.remove(input_path)
-        except: pass
-        try: os.remove(wav_path)
-        except: pass
+        raise prediction_error(e)
+
+@app.post("/predict_all_genres", response_model=AllGenresResponse)
+async def predict_all_genres(file: UploadFile, model: Optional[str] = Form(None)):
+    """
+    Popularity of one upload under every genre in GENRES, best first.
+    Features are extracted once; the genre only changes the encoded
+    ``track_genre`` column, so all genres are scored in one predict call.
+    """
+    state = await ensure_ready()
+    scorer = route_model(state, model)
+    ext = file_extension(file.filename)
+    file_bytes = await read_upload(file)
+
+    try:
+        feats = await extract_features_cached(file_bytes, ext, GENRES[0])
+        row = normalize_rows(scorer, [feats])[0]
+        X = scorer.normalizer.expand_genres(row, GENRES)
+        preds = await score(state, scorer, X)
+        metrics.PREDICTIONS.labels("all").inc(len(GENRES))
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=f"Server busy: {e}", headers={"Retry-After": "5"})
+    except Exception as e:
+        raise prediction_error(e)
+
+    ranking = [
+        GenreScore(track_genre=g, popularity=p, popularity_rounded=int(round(p)))
+        for g, p in sorted(zip(GENRES, preds.tolist()), key=lambda gp: gp[1], reverse=True)
+    ]
+    return AllGenresResponse(best=ranking[0], ranking=ranking,
+                             model_version=scorer.version, model=scorer.name)
+
+@app.post("/predict_batch", response_model=BatchPredictResponse)
+async def predict_batch(
+    files: List[UploadFile] = File(...),
+    track_genre: List[str] = Form(...),
+    model: Optional[str] = Form(None),
+):
+    """
+    Score many uploads in one call. ``track_genre`` is sent once for the whole
+    batch or once per file, in file order. Extraction fans out over the worker
+    pool; all successful rows are then scored by a single ``predict_matrix``.
+    Per-file failures are reported in ``error`` instead of failing the batch.
+    """
+    state = await ensure_ready()
+    scorer = route_model(state, model)
+
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many files (max {BATCH_MAX_FILES})")
+    if len(track_genre) == 1:
+        genres = track_genre * len(files)
+    elif len(track_genre) == len(files):
+        genres = track_genre
+    else:
+        raise HTTPException(
+            status_code=400,
+            detail="Send one track_genre for the batch or one per file"
+        )
+
+    items = [BatchItem(filename=f.filename or "", track_genre=g) for f, g in zip(files, genres)]
+
+    # Keep at most one job per worker in flight so a batch queues behind
+    # itself instead of tripping the pool's admission limit. Uploads stay
+    # spooled until their slot comes up, so at most that many are in memory.
+    slots = asyncio.Semaphore(EXTRACTION_POOL.max_workers)
+
+    async def extract(item: BatchItem, upload: UploadFile):
+        if item.track_genre not in GENRES:
+            raise ValueError(f"Unknown genre: {item.track_genre}")
+        try:
+            ext = file_extension(item.filename)
+        except HTTPException as e:
+            raise ValueError(e.detail)
+        async with slots:
+            file_bytes = await read_upload(upload)
+            return await extract_features_cached(file_bytes, ext, item.track_genre)
+
+    outcomes = await asyncio.gather(
+        *(extract(item, upload) for item, upload in zip(items, files)),
+        return_exceptions=True,
+    )
+
+    scored = []
+    for item, outcome in zip(items, outcomes):
+        if isinstance(outcome, BaseException):
+            item.error = str(outcome) or type(outcome).__name__
+        else:
+            scored.append((item, outcome))
+
+    if scored:
+        X = normalize_rows(scorer, [feats for _, feats in scored])
+        try:
+            preds = await score(state, scorer, X)
+        except Exception as e:
+            raise prediction_error(e)
+        for (item, _), popularity in zip(scored, preds.tolist()):
+            item.popularity = popularity
+            metrics.PREDICTIONS.labels(item.track_genre).inc()
+            item.popularity_rounded = int(round(popularity))
+
+    return BatchPredictResponse(
+        results=items,
+        succeeded=len(scored),
+        failed=len(items) - len(scored),
+        model_version=scorer.version,
+        model=scorer.name,
+    )
+
+@app.post("/predict_features")
+async def predict_features(request: Request, model: Optional[str] = None):
+    """
+    Score feature vectors directly, without audio analysis. The body is one
+    JSON object with the FEATURE_ORDER fields, or many rows as NDJSON
+    (``application/x-ndjson``) or an Arrow IPC stream
+    (``application/vnd.apache.arrow.stream``). Bulk input is scored in
+    chunks of FEATURES_CHUNK_ROWS and results stream back in the same
+    format and order, null for rows whose features aren't numeric. A bad
+    chunk after the first ends an NDJSON stream with an ``error`` line and
+    aborts an Arrow one. ``model`` routes as on /predict_file.
+    """
+    state = await ensure_ready()
+    scorer = route_model(state, model)
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip().lower()
+
+    if content_type == "application/json":
+        try:
+            row = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON")
+        if not isinstance(row, dict):
+            raise HTTPException(status_code=400,
+                                detail="Send one JSON object; use NDJSON or Arrow for many rows")
+        missing = [c for c in FEATURE_ORDER if c not in row]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Missing features: {', '.join(missing)}")
+        X = normalize_rows(scorer, [row])
+        if not np.isfinite(X).all():
+            raise HTTPException(status_code=400, detail="Features must be numeric")
+        popularity = float((await score(state, scorer, X))[0])
+        metrics.PREDICTIONS.labels("features").inc()
+        return FeaturePrediction(popularity=popularity, popularity_rounded=int(round(popularity)),
+                                 model_version=scorer.version, model=scorer.name)
+
+    if content_type in NDJSON_TYPES:
+        read_chunks, media_type, writer = iter_ndjson, "application/x-ndjson", None
+    elif content_type == ARROW_STREAM_TYPE:
+        read_chunks, media_type, writer = iter_arrow, ARROW_STREAM_TYPE, ArrowResultWriter()
+    else:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Unsupported Content-Type: {content_type}. Use application/json, "
+                   f"application/x-ndjson or {ARROW_STREAM_TYPE}",
+        )
+
+    # Bulk chunks skip shadow scoring: rescoring a catalog would only flood
+    # the shadow queue, which then drops the interactive requests' rows
+    body = await spool_body(request)
+    chunks = read_chunks(body)
+    try:
+        first = await run_in_threadpool(next_feature_chunk, scorer, chunks)
+    except ValueError as e:
+        body.close()
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def stream():
+        try:
+            preds = first
+            while preds is not None:
+                metrics.PREDICTIONS.labels("features").inc(len(preds))
+                yield ndjson_results(preds) if writer is None else writer.write(preds)
+                try:
+                    preds = await run_in_threadpool(next_feature_chunk, scorer, chunks)
+                except ValueError as e:
+                    logger.warning("/predict_features stopped mid-stream: %s", e)
+                    if writer is not None:
+                        raise
+                    yield (json.dumps({"error": str(e)}) + "\n").encode()
+                    return
+            if writer is not None:
+                yield writer.close()
+        finally:
+            body.close()
+
+    return StreamingResponse(
+        stream(), media_type=media_type,
+        headers={"X-Model-Version": scorer.version, "X-Model": scorer.name},
+    )
+
+@app.post("/jobs", response_model=JobStatus, status_code=202)
+async def create_job(
+    file: UploadFile,
+    track_genre: str = Form(...),
+    quality: str = Form(DEFAULT_QUALITY),
+    excerpts: bool = Form(False),
+):
+    """
+    Queue an upload and return at once. Poll ``GET /jobs/{id}`` or follow
+    ``GET /jobs/{id}/events``; no request stays open for the whole analysis.
+    503 once JOB_MAX_QUEUED jobs are already waiting.
+    """
+    if JOB_QUEUE.qsize() >= JOB_MAX_QUEUED:
+        metrics.REJECTED.inc()
+        raise HTTPException(status_code=503, detail=f"Server busy: {JOB_QUEUE.qsize()} jobs queued",
+                            headers={"Retry-After": "30"})
+    validate_options(track_genre, quality)
+    ext = file_extension(file.filename)
+    file_bytes = await read_upload(file)
+    job_id = await run_in_threadpool(
+        JOB_STORE.create, file_bytes, file.filename or "", ext, track_genre, quality, excerpts
+    )
+    start_job(job_id)
+    return await get_job_or_404(job_id)
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def job_status(job_id: str):
+    return await get_job_or_404(job_id)
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-sent events: the job's JobStatus on every change, until it is done or failed."""
+    await get_job_or_404(job_id)
+
+    async def stream():
+        last_update, last_sent = None, time.monotonic()
+        while True:
+            job = await run_in_threadpool(JOB_STORE.get, job_id)
+            if job is None:
+                return
+            if job["updated_at"] != last_update:
+                last_update, last_sent = job["updated_at"], time.monotonic()
+                yield f"event: {job['status']}\ndata: {JobStatus(**job).model_dump_json()}\n\n"
+            elif time.monotonic() - last_sent > JOB_KEEPALIVE_SECONDS:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            if job["status"] in ("done", "failed"):
+                return
+            await asyncio.sleep(JOB_POLL_SECONDS)
+
+    return StreamingResponse(
+        stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
+    )
 
 # ------------------------- Run server (Cloud Run) -------------------------
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8080))
+    # One uvicorn process per container: startup resumes every unfinished
+    # job and sizes the extraction pool to the whole machine, so extra
+    # workers would run jobs twice and oversubscribe the CPUs
     uvicorn.run("app:app", host="0.0.0.0", port=port)
@@ -0,0 +1,182 @@
+# backend/audio_io.py
+"""Decode uploaded audio bytes once into a mono float32 signal."""
+from __future__ import annotations
+import io
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from typing import Optional
+
+import numpy as np
+
+TARGET_SR = 22050
+
+# Resampler for every decode path: soxr_vhq, soxr_hq (librosa's default),
+# soxr_mq or soxr_lq
+AUDIO_RESAMPLER = os.environ.get("AUDIO_RESAMPLER", "soxr_hq")
+SOXR_PRECISION = {"soxr_vhq": 28, "soxr_hq": 20, "soxr_mq": 16, "soxr_lq": 16}
+
+# Containers libsndfile can't parse; decoded by piping the upload through
+# ffmpeg when it is on PATH, else by librosa/audioread from a temp file
+FFMPEG_EXTENSIONS = {".m4a", ".aac", ".wma"}
+FFMPEG_BIN = os.environ.get("FFMPEG_BIN", "ffmpeg")
+# Wall-clock limit per ffmpeg run: a base plus an allowance per MB of
+# upload, so a malformed file can't hang a worker
+FFMPEG_TIMEOUT_SECONDS = float(os.environ.get("FFMPEG_TIMEOUT_SECONDS", 30))
+FFMPEG_TIMEOUT_PER_MB = float(os.environ.get("FFMPEG_TIMEOUT_PER_MB", 5))
+
+class DecodeError(ValueError):
+    """The upload is not audio any decoder can read: bad input, not a server fault."""
+
+def decoder_errors() -> tuple:
+    """Exceptions libsndfile, ffmpeg (see decode_ffmpeg) and audioread raise for unreadable input."""
+    from audioread.exceptions import DecodeError as AudioreadError
+
+    return (RuntimeError, EOFError, OSError, AudioreadError)
+
+def decode_failed(ext: str, e: BaseException) -> DecodeError:
+    kind = f"{ext.lstrip('.')} file" if ext else "file"
+    detail = str(e) or f"unsupported or corrupt audio ({type(e).__name__})"
+    return DecodeError(f"Could not decode the {kind} as audio: {detail}")
+
+def soxr_quality(resampler: str = AUDIO_RESAMPLER) -> str:
+    """python-soxr quality name ("HQ", ...) for a resampler setting."""
+    if resampler not in SOXR_PRECISION:
+        raise ValueError(f"Unknown resampler: {resampler}. Allowed: {', '.join(SOXR_PRECISION)}")
+    return resampler[len("soxr_"):].upper()
+
+def resample(y: np.ndarray, orig_sr: int, sr: int, resampler: str = AUDIO_RESAMPLER) -> np.ndarray:
+    """float32 in, float32 out; soxr_hq matches ``librosa.resample`` exactly."""
+    import soxr
+
+    if orig_sr == sr:
+        return y
+    return soxr.resample(y, orig_sr, sr, quality=soxr_quality(resampler))
+
+def decode_audio(
+    file_bytes: bytes, ext: str = "", sr: int = TARGET_SR, resampler: str = AUDIO_RESAMPLER,
+) -> np.ndarray:
+    """
+    Decode ``file_bytes`` to mono float32 at ``sr``. With the default
+    resampler this is what ``librosa.load(path, sr=sr, mono=True)`` returns.
+
+    libsndfile decodes WAV/FLAC/OGG/MP3 straight from memory. m4a/aac/wma
+    are piped through ffmpeg, which downmixes and resamples (with soxr) in
+    the same pass; its output buffer is wrapped without a copy, so that
+    array is read-only. DecodeError if no decoder can read the upload.
+    """
+    import soundfile as sf
+
+    soxr_quality(resampler)  # reject unknown names before any decoding
+    if ext.lower() in FFMPEG_EXTENSIONS:
+        return _decode_compressed(file_bytes, ext, sr, resampler)
+    try:
+        y, native_sr = sf.read(io.BytesIO(file_bytes), dtype="float32", always_2d=True)
+    except (sf.LibsndfileError, RuntimeError):
+        return _decode_compressed(file_bytes, ext, sr, resampler)
+
+    # Same downmix as librosa.to_mono, without a copy for mono files
+    y = y[:, 0] if y.shape[1] == 1 else y.mean(axis=1)
+    return resample(y, native_sr, sr, resampler)
+
+def _decode_compressed(file_bytes: bytes, ext: str, sr: int, resampler: str) -> np.ndarray:
+    ffmpeg = has_ffmpeg()
+    if ffmpeg:
+        try:
+            return decode_ffmpeg(file_bytes, sr, resampler)
+        except RuntimeError:
+            pass  # e.g. an MP4 whose index sits at the end needs a seekable input
+
+    # Seekable input: spool the upload to a temp file
+    with tempfile.NamedTemporaryFile(suffix=ext) as tmp:
+        tmp.write(file_bytes)
+        tmp.flush()
+        try:
+            if ffmpeg:
+                return decode_ffmpeg(b"", sr, resampler, path=tmp.name)
+
+            import librosa
+
+            y, _ = librosa.load(tmp.name, sr=sr, mono=True, res_type=resampler)
+        except decoder_errors() as e:
+            raise decode_failed(ext, e) from e
+    return np.asarray(y, dtype=np.float32)
+
+def _run_ffmpeg(cmd: list, stdin: Optional[bytes], size: int) -> subprocess.CompletedProcess:
+    timeout = FFMPEG_TIMEOUT_SECONDS + FFMPEG_TIMEOUT_PER_MB * size / 1e6
+    try:
+        return subprocess.run(cmd, input=stdin, capture_output=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        # Not a RuntimeError, so callers don't retry it another way
+        raise DecodeError(f"Could not decode the file as audio: ffmpeg timed out after {timeout:.0f}s") from None
+
+def has_ffmpeg() -> bool:
+    return shutil.which(FFMPEG_BIN) is not None
+
+def decode_ffmpeg(
+    file_bytes: bytes, sr: int = TARGET_SR, resampler: str = AUDIO_RESAMPLER, path: Optional[str] = None,
+    offset: Optional[float] = None, duration: Optional[float] = None,
+) -> np.ndarray:
+    """
+    Run an upload (piped on stdin, or read from ``path``) through ffmpeg to
+    mono float32 PCM at ``sr``; RuntimeError if ffmpeg fails, DecodeError
+    if it runs past its timeout (see _run_ffmpeg). ``offset`` and
+    ``duration`` (seconds) select a window; with ``path`` ffmpeg seeks to it
+    instead of decoding everything before it.
+    """
+    window = []
+    if offset is not None:
+        window += ["-ss", f"{offset:.3f}"]
+    if duration is not None:
+        window += ["-t", f"{duration:.3f}"]
+    cmd = [
+        FFMPEG_BIN, "-nostdin", "-hide_banner", "-loglevel", "error",
+        *window, "-i", path or "pipe:0",
+        "-af", f"aresample=resampler=soxr:precision={SOXR_PRECISION[resampler]}",
+        "-ac", "1", "-ar", str(sr), "-f", "f32le", "pipe:1",
+    ]
+    size = os.path.getsize(path) if path else len(file_bytes)
+    proc = _run_ffmpeg(cmd, None if path else file_bytes, size)
+    if proc.returncode != 0 or not proc.stdout:
+        raise RuntimeError(f"ffmpeg failed: {proc.stderr.decode(errors='replace').strip()[-300:]}")
+    return np.frombuffer(proc.stdout, dtype=np.float32)
+
+_DURATION_RE = re.compile(rb"Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+
+def ffmpeg_duration(path: str) -> Optional[float]:
+    """Duration in seconds from the container as ffmpeg reports it (no decoding); None if unknown."""
+    proc = _run_ffmpeg([FFMPEG_BIN, "-nostdin", "-hide_banner", "-i", path], None, 0)
+    m = _DURATION_RE.search(proc.stderr)
+    if m is None:
+        return None
+    hours, minutes, seconds = m.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+def synthetic_clip(seconds: float = 2.0, sr: int = TARGET_SR) -> np.ndarray:
+    """Deterministic test signal (A-minor triad over 120 BPM clicks) for warm-ups."""
+    t = np.arange(int(seconds * sr)) / sr
+    y = sum(0.2 * np.sin(2 * np.pi * f * t) for f in (220.0, 261.63, 329.63))
+    clicks = np.zeros_like(t)
+    clicks[(np.arange(0.0, seconds, 0.5) * sr).astype(int)] = 1.0
+    y += 0.5 * np.convolve(clicks, np.exp(-np.arange(400) / 40.0), mode="same")
+    return y.astype(np.float32)
+
+def encode_wav(y: np.ndarray, sr: int = TARGET_SR) -> bytes:
+    """16-bit PCM WAV bytes for ``y``, e.g. to push a synthetic clip through the upload path."""
+    import soundfile as sf
+
+    buf = io.BytesIO()
+    sf.write(buf, y, sr, format="WAV", subtype="PCM_16")
+    return buf.getvalue()
+
+def header_duration(file_bytes: bytes) -> Optional[float]:
+    """Duration in seconds from the container header, or None if libsndfile can't parse it."""
+    import soundfile as sf
+
+    try:
+        info = sf.info(io.BytesIO(file_bytes))
+    except (sf.LibsndfileError, RuntimeError):
+        return None
+    return info.frames / info.samplerate if info.samplerate else None
@@ -0,0 +1,213 @@
+# backend/excerpt_features.py
+"""
+Excerpt-sampling extraction: analyze a few representative windows of a
+track instead of all of it.
+
+A cheap RMS scan reads EXCERPT_PROBES short probes spread over the file
+(seeking, never decoding the gaps) and picks up to EXCERPT_COUNT windows of
+EXCERPT_SECONDS each: the biggest loudness rise into a loud section (the
+likely chorus), the middle of the track and the intro after any leading
+silence. Only those windows are decoded and analyzed, so the work per track
+is bounded by EXCERPT_COUNT * EXCERPT_SECONDS of audio however long the
+upload is. ``duration_ms`` still comes from the file header.
+
+Containers libsndfile can't open (m4a/aac/wma) get no probe scan: their
+windows are spaced evenly and each is decoded by ffmpeg seeking straight
+to it, so those files aren't decoded in full either.
+
+Per-window measurements are pooled by window length: means are averaged,
+RMS and MFCC variances are pooled with their means, chroma profiles are
+averaged before picking key and mode, and tempo is the median over windows.
+"""
+from __future__ import annotations
+import io
+import os
+import tempfile
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from audio_io import (
+    AUDIO_RESAMPLER, decode_audio, decode_failed, decode_ffmpeg, decoder_errors, ffmpeg_duration,
+    has_ffmpeg, resample,
+)
+from extract_features import (
+    QUALITY_TIERS,
+    estimate_key_from_chroma,
+    estimate_mode_from_chroma,
+    extract_heuristic_features,
+    features_from_measurements,
+    measure_signal,
+    timed,
+)
+
+# Windows per track, seconds per window, and probes/probe length for the RMS scan
+EXCERPT_COUNT = int(os.environ.get("EXCERPT_COUNT", 3))
+EXCERPT_SECONDS = float(os.environ.get("EXCERPT_SECONDS", 12))
+EXCERPT_PROBES = int(os.environ.get("EXCERPT_PROBES", 40))
+PROBE_SECONDS = 0.25
+
+def _overlaps(start: float, chosen: List[float], seconds: float) -> bool:
+    return any(abs(start - c) < seconds for c in chosen)
+
+def choose_windows(
+    probe_times: np.ndarray, probe_db: np.ndarray, duration: float,
+    count: int = EXCERPT_COUNT, seconds: float = EXCERPT_SECONDS,
+) -> List[float]:
+    """Sorted, non-overlapping window start times (s) from an RMS probe scan."""
+    last = max(0.0, duration - seconds)
+    clamp = lambda t: float(min(max(t, 0.0), last))
+
+    # Biggest rise into a section at least as loud as the track's median
+    rise = np.diff(probe_db, prepend=probe_db[:1])
+    loud = probe_db >= np.median(probe_db)
+    order = np.argsort(-np.where(loud, rise, -np.inf), kind="stable")
+    novelty = [clamp(probe_times[i]) for i in order if loud[i]]
+
+    audible = np.flatnonzero(probe_db > probe_db.max() - 30.0)
+    intro = clamp(probe_times[audible[0]] if audible.size else 0.0)
+    middle = clamp(duration / 2 - seconds / 2)
+    evenly = [clamp((k + 0.5) * duration / count - seconds / 2) for k in range(count)]
+
+    chosen: List[float] = []
+    for start in novelty[:1] + [middle, intro] + novelty[1:] + evenly:
+        if len(chosen) == count:
+            break
+        if not _overlaps(start, chosen, seconds):
+            chosen.append(start)
+    return sorted(chosen)
+
+def read_excerpts(
+    file_bytes: bytes, sr: int, ext: str = "",
+    count: int = EXCERPT_COUNT, seconds: float = EXCERPT_SECONDS,
+) -> Tuple[Optional[List[np.ndarray]], float]:
+    """
+    (mono float32 windows at ``sr``, true duration in s). Windows is None
+    when the track is short enough to analyze whole.
+    """
+    import soundfile as sf
+
+    try:
+        f = sf.SoundFile(io.BytesIO(file_bytes))
+    except (sf.LibsndfileError, RuntimeError):
+        return _read_excerpts_compressed(file_bytes, sr, ext, count, seconds)
+
+    with f:
+        native_sr, duration = f.samplerate, f.frames / f.samplerate
+        if duration <= count * seconds:
+            return None, duration
+
+        n_probe = int(PROBE_SECONDS * native_sr)
+        probe_times = np.linspace(0.0, duration - PROBE_SECONDS, EXCERPT_PROBES)
+        probe_db = np.empty(len(probe_times))
+        for i, t in enumerate(probe_times):
+            f.seek(int(t * native_sr))
+            block = f.read(n_probe, dtype="float32", always_2d=True)
+            probe_db[i] = 10 * np.log10(np.mean(block ** 2) + 1e-10)
+
+        windows = []
+        for start in choose_windows(probe_times, probe_db, duration, count, seconds):
+            f.seek(int(start * native_sr))
+            block = f.read(int(seconds * native_sr), dtype="float32", always_2d=True)
+            y = block[:, 0] if block.shape[1] == 1 else block.mean(axis=1)
+            windows.append(resample(y, native_sr, sr))
+    return windows, duration
+
+def _evenly_spaced(duration: float, count: int, seconds: float) -> List[float]:
+    return [max(0.0, (k + 0.5) * duration / count - seconds / 2) for k in range(count)]
+
+def _read_excerpts_compressed(file_bytes, sr, ext, count, seconds):
+    # Containers libsndfile can't open: no cheap seek-and-probe scan, so take
+    # evenly spaced windows. ffmpeg reads the duration from the container and
+    # seeks to each window; audioread (no ffmpeg) has to decode up to it.
+    with tempfile.NamedTemporaryFile(suffix=ext) as tmp:
+        tmp.write(file_bytes)
+        tmp.flush()
+        if not has_ffmpeg():
+            return _read_excerpts_audioread(tmp.name, sr, ext, count, seconds)
+        duration = ffmpeg_duration(tmp.name)
+        if duration is None or duration <= count * seconds:
+            return None, duration or 0.0
+        try:
+            windows = [
+                decode_ffmpeg(b"", sr, AUDIO_RESAMPLER, path=tmp.name, offset=start, duration=seconds)
+                for start in _evenly_spaced(duration, count, seconds)
+            ]
+        except RuntimeError as e:
+            raise decode_failed(ext, e) from e
+    return windows, duration
+
+def _read_excerpts_audioread(path, sr, ext, count, seconds):
+    import librosa
+
+    try:
+        duration = float(librosa.get_duration(path=path))
+    except decoder_errors() as e:
+        raise decode_failed(ext, e) from e
+    if duration <= count * seconds:
+        return None, duration
+    windows = []
+    for start in _evenly_spaced(duration, count, seconds):
+        y, _ = librosa.load(path, sr=sr, mono=True, offset=start, duration=seconds, res_type=AUDIO_RESAMPLER)
+        windows.append(np.asarray(y, dtype=np.float32))
+    return windows, duration
+
+def pool_measurements(parts: List[dict], duration_ms: int) -> dict:
+    """Combine per-window ``measure_signal`` outputs into one measurement set."""
+    w = np.array([p["duration_ms"] for p in parts], dtype=np.float64)
+    w /= w.sum()
+    mean = lambda k: float(np.dot(w, [p[k] for p in parts]))
+
+    def pooled_var(var_key, mean_key):
+        grand = mean(mean_key)
+        return float(np.dot(w, [p[var_key] + (p[mean_key] - grand) ** 2 for p in parts]))
+
+    chroma = np.average([p["chroma_profile"] for p in parts], axis=0, weights=w)[:, None]
+    return {
+        "sr": parts[0]["sr"],
+        "duration_ms": duration_ms,
+        "tempo": float(np.median([p["tempo"] for p in parts])),
+        "beat_reg": mean("beat_reg"),
+        "onset_mean": mean("onset_mean"),
+        "rms_mean": mean("rms_mean"),
+        "rms_var": pooled_var("rms_var", "rms_mean"),
+        "centroid": mean("centroid"),
+        "rolloff": mean("rolloff"),
+        "flatness": mean("flatness"),
+        "harm_ratio": mean("harm_ratio"),
+        "zcr": mean("zcr"),
+        "mfcc_var": pooled_var("mfcc_var", "mfcc_mean"),
+        "key_idx": estimate_key_from_chroma(chroma),
+        "mode": estimate_mode_from_chroma(chroma),
+    }
+
+def extract_heuristic_features_excerpts(
+    file_bytes: bytes,
+    ext: str = "",
+    explicit: int = 0,
+    track_genre: str = "unknown",
+    sr: int = 22050,
+    quality: str = "full",
+    timings: Optional[dict] = None,
+):
+    """
+    Same feature dict as ``extract_heuristic_features_from_audio``, from a
+    few excerpts. ``timings`` collects seconds per stage, scan included in "decode".
+    """
+    if quality not in QUALITY_TIERS:
+        raise ValueError(f"Unknown quality tier: {quality}")
+    if quality != "full":
+        sr = QUALITY_TIERS[quality]["sr"]
+
+    with timed(timings, "decode"):
+        windows, duration = read_excerpts(file_bytes, sr, ext)
+        if windows is None:
+            y = decode_audio(file_bytes, ext=ext, sr=sr)
+    if windows is None:
+        return extract_heuristic_features(
+            y, sr, explicit=explicit, track_genre=track_genre, quality=quality, timings=timings
+        )
+
+    parts = [measure_signal(y, sr, quality=quality, timings=timings) for y in windows]
+    m = pool_measurements(parts, int(round(duration * 1000)))
+    return features_from_measurements(**m, explicit=explicit, track_genre=track_genre)
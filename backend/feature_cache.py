@@ -0,0 +1,191 @@
+# backend/feature_cache.py
+"""Content-addressed cache of extracted audio features (memory LRU + disk)."""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+# Entries kept in memory, on-disk budget, disk location ("" disables disk)
+# and eviction policy: "lru" refreshes an entry on every hit, "fifo" evicts
+# strictly by insertion order.
+FEATURE_CACHE_ENTRIES = int(os.environ.get("FEATURE_CACHE_ENTRIES", 1024))
+FEATURE_CACHE_DISK_MB = float(os.environ.get("FEATURE_CACHE_DISK_MB", 256))
+FEATURE_CACHE_DIR = os.environ.get(
+    "FEATURE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "song-popularity-features")
+)
+FEATURE_CACHE_POLICY = os.environ.get("FEATURE_CACHE_POLICY", "lru")
+# Once over budget, the disk tier is evicted down to this share of it, so
+# the directory scan eviction needs runs once per ~10% of turnover rather
+# than on every write
+FEATURE_CACHE_DISK_LOW_WATER = 0.9
+
+def content_key(file_bytes: bytes, variant: str = "") -> str:
+    """SHA-256 of the upload, suffixed with anything else the features depend on."""
+    digest = hashlib.sha256(file_bytes).hexdigest()
+    return f"{digest}.{variant}" if variant else digest
+
+class FeatureCache:
+    """
+    Maps an upload's content key to its genre-independent raw feature dict.
+
+    A memory hit costs a dict lookup; a disk hit reads one small JSON file
+    and promotes it to memory. Disk writes are atomic (temp file + rename),
+    so concurrent workers never see partial entries.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = FEATURE_CACHE_ENTRIES,
+        disk_dir: str = FEATURE_CACHE_DIR,
+        disk_max_bytes: int = int(FEATURE_CACHE_DISK_MB * 1024 * 1024),
+        policy: str = FEATURE_CACHE_POLICY,
+    ):
+        if policy not in ("lru", "fifo"):
+            raise ValueError(f"Unknown cache policy: {policy}")
+        self.max_entries = max(0, max_entries)
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = max(0, disk_max_bytes)
+        self.policy = policy
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._mem: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, _, size in self._disk_entries())
+            if self._disk_bytes > self.disk_max_bytes:
+                self._disk_evict()
+
+    # ------------------------- public API -------------------------
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            feats = self._mem.get(key)
+            if feats is not None:
+                if self.policy == "lru":
+                    self._mem.move_to_end(key)
+                self.memory_hits += 1
+                return dict(feats)
+
+        feats = self._disk_get(key)
+        with self._lock:
+            if feats is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._mem_put(key, feats)
+        return dict(feats)
+
+    def put(self, key: str, feats: dict) -> None:
+        feats = {k: v for k, v in feats.items() if k != "track_genre"}
+        with self._lock:
+            self._mem_put(key, feats)
+        self._disk_put(key, feats)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "policy": self.policy,
+                "entries": len(self._mem),
+                "max_entries": self.max_entries,
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes if self.disk_dir else 0,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    # ------------------------- memory tier -------------------------
+    def _mem_put(self, key: str, feats: dict) -> None:
+        if self.max_entries == 0:
+            return
+        self._mem[key] = feats
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self.evictions += 1
+
+    # ------------------------- disk tier -------------------------
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_entries(self):
+        """(mtime, path, size) for every cached file, oldest first."""
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".json"):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, entry.path, st.st_size))
+        return sorted(entries)
+
+    def _disk_get(self, key: str) -> Optional[dict]:
+        if not self.disk_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                feats = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if self.policy == "lru":
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return feats
+
+    def _disk_put(self, key: str, feats: dict) -> None:
+        if not self.disk_dir or self.disk_max_bytes == 0:
+            return
+        data = json.dumps(feats).encode("utf-8")
+        path = self._path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            self._disk_bytes += len(data) - replaced
+            over = self._disk_bytes > self.disk_max_bytes
+        if over:
+            self._disk_evict()
+
+    def _disk_evict(self) -> None:
+        # Oldest mtime first: with "lru" hits refresh mtime, with "fifo" they don't
+        target = int(self.disk_max_bytes * FEATURE_CACHE_DISK_LOW_WATER)
+        for _, path, size in self._disk_entries():
+            with self._lock:
+                if self._disk_bytes <= target:
+                    return
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            with self._lock:
+                self._disk_bytes -= size
+                self.evictions += 1
@@ -0,0 +1,108 @@
+# backend/feature_io.py
+"""
+Bulk feature-vector input and output for /predict_features.
+
+Requests are NDJSON (one FEATURE_ORDER object per line) or an Arrow IPC
+stream with FEATURE_ORDER columns; both are read in chunks of at most
+FEATURES_CHUNK_ROWS rows as columns, so every chunk is normalized and
+scored with whole-column array math. Results go back in the request's
+format, one chunk at a time, in input order.
+"""
+from __future__ import annotations
+import io
+import itertools
+import json
+import os
+from typing import IO, Dict, Iterator
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.json as pa_json
+
+from normalize_output import FEATURE_ORDER
+
+# Rows parsed, normalized and scored per step; bounds memory per request
+FEATURES_CHUNK_ROWS = int(os.environ.get("FEATURES_CHUNK_ROWS", 65536))
+
+NDJSON_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+ARROW_STREAM_TYPE = "application/vnd.apache.arrow.stream"
+
+RESULT_SCHEMA = pa.schema([("popularity", pa.float64())])
+
+Columns = Dict[str, pd.Series]
+
+def table_columns(table) -> Columns:
+    """FEATURE_ORDER columns of a pyarrow Table/RecordBatch or DataFrame; ValueError if any is missing."""
+    names = table.columns if isinstance(table, pd.DataFrame) else table.column_names
+    missing = [c for c in FEATURE_ORDER if c not in names]
+    if missing:
+        raise ValueError(f"Missing features: {', '.join(missing)}")
+    if isinstance(table, pd.DataFrame):
+        return {c: table[c] for c in FEATURE_ORDER}
+    return {c: table.column(c).to_pandas() for c in FEATURE_ORDER}
+
+def _parse_ndjson(lines) -> Columns:
+    block = b"".join(line if line.endswith(b"\n") else line + b"\n" for line in lines)
+    try:
+        table = pa_json.read_json(io.BytesIO(block), read_options=pa_json.ReadOptions(block_size=len(block)))
+    except pa.ArrowInvalid:
+        # pyarrow wants one type per field, so e.g. a "tempo" that is a number
+        # in one row and a string in the next needs the slow path
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError as e:
+                raise ValueError(f"Invalid NDJSON line {line[:80]!r}: {e}") from None
+        if not all(isinstance(r, dict) for r in records):
+            raise ValueError("Invalid NDJSON: every line must be a JSON object") from None
+        table = pd.DataFrame.from_records(records)
+    return table_columns(table)
+
+def iter_ndjson(f: IO[bytes], chunk_rows: int = FEATURES_CHUNK_ROWS) -> Iterator[Columns]:
+    """Columns of up to ``chunk_rows`` lines at a time; blank lines are skipped."""
+    lines = (line for line in f if line.strip())
+    while True:
+        chunk = list(itertools.islice(lines, chunk_rows))
+        if not chunk:
+            return
+        yield _parse_ndjson(chunk)
+
+def iter_arrow(f: IO[bytes], chunk_rows: int = FEATURES_CHUNK_ROWS) -> Iterator[Columns]:
+    """Columns of an Arrow IPC stream's record batches, split to at most ``chunk_rows`` rows."""
+    try:
+        reader = pa.ipc.open_stream(f)
+        for batch in reader:
+            for start in range(0, batch.num_rows, chunk_rows):
+                yield table_columns(batch.slice(start, chunk_rows))
+    except pa.ArrowInvalid as e:
+        raise ValueError(f"Invalid Arrow IPC stream: {e}") from None
+
+def ndjson_results(preds: np.ndarray) -> bytes:
+    """One ``{"popularity": ...}`` line per row; NaN (unscorable row) becomes null."""
+    return "".join(
+        json.dumps({"popularity": None if p != p else p}) + "\n" for p in preds.tolist()
+    ).encode()
+
+class ArrowResultWriter:
+    """Arrow IPC stream of RESULT_SCHEMA, drained batch by batch."""
+
+    def __init__(self):
+        self._sink = io.BytesIO()
+        self._writer = pa.ipc.new_stream(self._sink, RESULT_SCHEMA)
+
+    def _drain(self) -> bytes:
+        data = self._sink.getvalue()
+        self._sink.seek(0)
+        self._sink.truncate()
+        return data
+
+    def write(self, preds: np.ndarray) -> bytes:
+        column = pa.array(preds, type=pa.float64(), from_pandas=True)  # NaN -> null
+        self._writer.write_batch(pa.record_batch([column], schema=RESULT_SCHEMA))
+        return self._drain()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._drain()
@@ -0,0 +1,139 @@
+# backend/forest_engine.py
+"""
+Flattened-array inference for sklearn tree ensembles.
+
+``compile_forest`` copies every tree of a fitted RandomForestRegressor
+(or ExtraTreesRegressor, or a single decision tree) into one set of
+contiguous numpy arrays. ``FlatForest.predict`` then walks all
+trees for all rows together, one vectorized step per tree level, with no
+input validation, thread dispatch or per-tree Python calls.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+class FlatForest:
+    """
+    All trees' nodes in shared arrays; ``roots[t]`` is tree t's first node.
+
+    Leaves point to themselves, so a (row, tree) pair that reaches its leaf
+    early just stays there until the next compaction retires it.
+    """
+
+    ARRAYS = ("feature", "threshold", "left", "right", "missing_left", "value", "roots")
+    COMPACT_EVERY = 4
+
+    def __init__(self, feature, threshold, left, right, missing_left, value, roots, max_depth: int):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    def to_arrays(self) -> dict:
+        """Arrays plus scalar metadata, e.g. for ``np.savez`` or ``np.save``."""
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        arrays["max_depth"] = np.array(self.max_depth)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays) -> "FlatForest":
+        kwargs = {name: arrays[name] for name in cls.ARRAYS}
+        return cls(max_depth=int(arrays["max_depth"]), **kwargs)
+
+    def predict(self, X) -> np.ndarray:
+        """Mean leaf value over trees for each row of ``X`` (N, n_features)."""
+        # sklearn trees compare float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        n_rows, n_features = X.shape
+        Xf = X.ravel()
+        has_nan = bool(np.isnan(Xf).any())
+
+        # One entry per (row, tree) pair, walked level by level
+        node = np.tile(self.roots, n_rows)
+        base = np.repeat(np.arange(n_rows) * n_features, self.n_trees)
+        pos = np.arange(node.size)
+        leaf = np.empty_like(node)
+
+        for depth in range(self.max_depth):
+            x = Xf[base + self.feature[node]]
+            go_left = x <= self.threshold[node]
+            if has_nan:
+                go_left = np.where(np.isnan(x), self.missing_left[node], go_left)
+            node = np.where(go_left, self.left[node], self.right[node])
+
+            # Every few levels, retire pairs that reached a leaf so deep
+            # trees don't drag the finished ones along
+            if depth % self.COMPACT_EVERY == self.COMPACT_EVERY - 1:
+                done = self.left[node] == node
+                if done.any():
+                    leaf[pos[done]] = node[done]
+                    keep = ~done
+                    node, base, pos = node[keep], base[keep], pos[keep]
+                    if not node.size:
+                        break
+        leaf[pos] = node
+        return self.value[leaf].reshape(n_rows, self.n_trees).mean(axis=1)
+
+    def max_abs_diff(self, model, X) -> float:
+        """Largest |flat - sklearn| prediction gap on ``X``."""
+        return float(np.max(np.abs(self.predict(X) - model.predict(X))))
+
+def compile_forest(model) -> FlatForest:
+    """Flatten a fitted single-output tree regressor/ensemble into a FlatForest."""
+    from sklearn.ensemble import ExtraTreesRegressor, RandomForestRegressor
+    from sklearn.tree import DecisionTreeRegressor
+
+    if isinstance(model, (RandomForestRegressor, ExtraTreesRegressor)):
+        trees = [est.tree_ for est in model.estimators_]
+    elif isinstance(model, DecisionTreeRegressor):
+        trees = [model.tree_]
+    else:
+        raise TypeError(f"Unsupported model for flat inference: {type(model).__name__}")
+    if any(t.n_outputs != 1 for t in trees):
+        raise TypeError("Only single-output regressors are supported")
+
+    sizes = np.array([t.node_count for t in trees])
+    roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int32)
+    n = int(sizes.sum())
+
+    feature = np.empty(n, dtype=np.int32)
+    threshold = np.empty(n, dtype=np.float64)
+    left = np.empty(n, dtype=np.int32)
+    right = np.empty(n, dtype=np.int32)
+    missing_left = np.zeros(n, dtype=bool)
+    value = np.empty(n, dtype=np.float64)
+
+    for t, root in zip(trees, roots.tolist()):
+        sl = slice(root, root + t.node_count)
+        own = np.arange(root, root + t.node_count, dtype=np.int32)
+        is_leaf = t.children_left < 0
+        feature[sl] = np.where(is_leaf, 0, t.feature)
+        threshold[sl] = np.where(is_leaf, np.inf, t.threshold)
+        left[sl] = np.where(is_leaf, own, t.children_left + root)
+        right[sl] = np.where(is_leaf, own, t.children_right + root)
+        if hasattr(t, "missing_go_to_left"):
+            missing_left[sl] = t.missing_go_to_left.astype(bool) & ~is_leaf
+        value[sl] = t.value[:, 0, 0]
+
+    return FlatForest(
+        feature, threshold, left, right, missing_left, value, roots,
+        max_depth=max(t.max_depth for t in trees),
+    )
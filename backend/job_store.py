@@ -0,0 +1,159 @@
+# backend/job_store.py
+"""
+SQLite-backed state for asynchronous /jobs uploads.
+
+Uploads are spooled to JOB_DIR and each job's status, stage, result and
+error live in one SQLite row, so a job queued or running when the server
+stops is picked up again on the next start. Extraction workers are
+separate processes; they update the stage through their own connection,
+which is why every call opens a short-lived connection (WAL mode, so
+readers never block the writer).
+"""
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+from contextlib import closing
+from typing import List, Optional
+
+# Where the database and spooled uploads live, and how long finished jobs
+# (and their uploads) are kept.
+JOB_DIR = os.environ.get("JOB_DIR", os.path.join(tempfile.gettempdir(), "song-popularity-jobs"))
+JOB_TTL_HOURS = float(os.environ.get("JOB_TTL_HOURS", 24))
+
+# Progress stages in order, with the share of the work done when reached
+STAGES = {"queued": 0.0, "received": 0.05, "decoded": 0.4, "features": 0.8, "predicted": 1.0}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    status      TEXT NOT NULL,
+    stage       TEXT NOT NULL,
+    filename    TEXT NOT NULL,
+    ext         TEXT NOT NULL,
+    track_genre TEXT NOT NULL,
+    quality     TEXT NOT NULL,
+    excerpts    INTEGER NOT NULL,
+    result      TEXT,
+    error       TEXT,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+)
+"""
+
+class JobStore:
+    """Job rows plus spooled upload files under ``job_dir``."""
+
+    def __init__(self, job_dir: str = JOB_DIR, ttl_hours: float = JOB_TTL_HOURS):
+        self.job_dir = job_dir
+        self.upload_dir = os.path.join(job_dir, "uploads")
+        self.db_path = os.path.join(job_dir, "jobs.sqlite3")
+        self.ttl_seconds = ttl_hours * 3600.0
+        os.makedirs(self.upload_dir, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30.0)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def upload_path(self, job_id: str, ext: str) -> str:
+        return os.path.join(self.upload_dir, f"{job_id}{ext}")
+
+    # ------------------------- writes -------------------------
+    def create(self, file_bytes: bytes, filename: str, ext: str, track_genre: str,
+               quality: str = "full", excerpts: bool = False) -> str:
+        """Spool the upload and insert a queued job; returns its id."""
+        job_id = uuid.uuid4().hex
+        path = self.upload_path(job_id, ext)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(file_bytes)
+        os.replace(tmp, path)
+
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, stage, filename, ext, track_genre, quality, excerpts,"
+                " created_at, updated_at) VALUES (?, 'queued', 'queued', ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, filename, ext, track_genre, quality, int(excerpts), now, now),
+            )
+        return job_id
+
+    def set_stage(self, job_id: str, stage: str) -> None:
+        """Mark the job running at ``stage`` (see STAGES)."""
+        if stage not in STAGES:
+            raise ValueError(f"Unknown job stage: {stage}")
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', stage = ?, updated_at = ?"
+                " WHERE id = ? AND status IN ('queued', 'running')",
+                (stage, time.time(), job_id),
+            )
+
+    def finish(self, job_id: str, result: dict) -> None:
+        self._close(job_id, "done", "predicted", result=json.dumps(result))
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._close(job_id, "failed", None, error=error)
+
+    def _close(self, job_id: str, status: str, stage: Optional[str], result=None, error=None) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, stage = COALESCE(?, stage), result = ?, error = ?,"
+                " updated_at = ? WHERE id = ?",
+                (status, stage, result, error, time.time(), job_id),
+            )
+        # The upload is only needed to (re)run the job
+        self._remove_upload(job_id)
+
+    def _remove_upload(self, job_id: str) -> None:
+        for name in os.listdir(self.upload_dir):
+            if name.startswith(job_id):
+                try:
+                    os.remove(os.path.join(self.upload_dir, name))
+                except FileNotFoundError:
+                    pass
+
+    def purge_expired(self) -> int:
+        """Delete finished jobs older than the TTL; returns how many were removed."""
+        cutoff = time.time() - self.ttl_seconds
+        with closing(self._connect()) as conn, conn:
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,)
+            ).fetchall()
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,)
+            )
+        for row in rows:
+            self._remove_upload(row["id"])
+        return len(rows)
+
+    # ------------------------- reads -------------------------
+    def get(self, job_id: str) -> Optional[dict]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["excerpts"] = bool(job["excerpts"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["progress"] = STAGES[job["stage"]]
+        return job
+
+    def unfinished(self) -> List[str]:
+        """Ids of queued or running jobs, oldest first (to resume after a restart)."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def read_upload(self, job_id: str, ext: str) -> bytes:
+        with open(self.upload_path(job_id, ext), "rb") as f:
+            return f.read()
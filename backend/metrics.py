@@ -0,0 +1,119 @@
+# backend/metrics.py
+"""
+Prometheus metrics served at /metrics.
+
+Extraction runs in worker processes, so workers only time their stages and
+return the timings (see workers.extract_job); everything is observed here,
+in the API process, and no multiprocess collector setup is needed. Process
+CPU/RSS come from prometheus_client's default process collector; worker RSS
+is summed from /proc.
+"""
+from __future__ import annotations
+import os
+from typing import Dict
+
+from prometheus_client import Counter, Gauge, Histogram, Info
+
+# Stage latencies run from ~1 ms (cache hits, normalization) to minutes
+# (full-length extraction)
+STAGE_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+)
+
+STAGE_SECONDS = Histogram(
+    "song_popularity_stage_seconds",
+    "Time spent per request stage: read, decode, stft, beat, onset, spectral, "
+    "hpss, mfcc, chroma, stream, normalize, predict",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "song_popularity_request_seconds",
+    "End-to-end latency of prediction endpoints",
+    ["endpoint"],
+    buckets=STAGE_BUCKETS,
+)
+UPLOADS = Counter(
+    "song_popularity_uploads_total",
+    "Audio files received, by extension",
+    ["extension"],
+)
+PREDICTIONS = Counter(
+    "song_popularity_predictions_total",
+    "Popularity scores returned, by requested genre",
+    ["track_genre"],
+)
+EXTRACTIONS = Counter(
+    "song_popularity_extractions_total",
+    "Feature lookups by outcome: cache hit, shared with an identical in-flight upload, or extracted",
+    ["source"],
+)
+REJECTED = Counter(
+    "song_popularity_rejected_total",
+    "Uploads turned away with 503 because the extraction or /jobs queue was full",
+)
+MODEL_RELOADS = Counter(
+    "song_popularity_model_reloads_total",
+    "Hot reloads of the model bundle, by outcome (ok, failed)",
+    ["outcome"],
+)
+MODEL_INFO = Info(
+    "song_popularity_model",
+    "Version and class of the model being served",
+)
+SHADOW_ABS_DIFF = Histogram(
+    "song_popularity_shadow_abs_diff",
+    "Per-row |shadow - served| popularity difference, by shadow model",
+    ["model"],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0),
+)
+SHADOW_SECONDS = Histogram(
+    "song_popularity_shadow_seconds",
+    "Time a shadow model took to score one request's rows",
+    ["model"],
+    buckets=STAGE_BUCKETS,
+)
+SHADOW_DROPPED = Counter(
+    "song_popularity_shadow_dropped_total",
+    "Shadow scorings skipped because too many were already pending",
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "song_popularity_requests_in_flight",
+    "Prediction requests currently being served",
+)
+EXTRACTIONS_IN_FLIGHT = Gauge(
+    "song_popularity_extractions_in_flight",
+    "Extraction jobs admitted to the worker pool (running or queued)",
+)
+QUEUE_DEPTH = Gauge(
+    "song_popularity_extraction_queue_depth",
+    "Extraction jobs waiting for a free worker",
+)
+JOBS_QUEUED = Gauge(
+    "song_popularity_jobs_queued",
+    "/jobs submissions waiting for a job runner",
+)
+WORKERS_RSS = Gauge(
+    "song_popularity_workers_resident_memory_bytes",
+    "Summed resident memory of the extraction worker processes",
+)
+
+def observe_stages(timings: Dict[str, float]) -> None:
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.labels(stage).observe(seconds)
+
+def resident_bytes(pid: int) -> int:
+    """RSS of ``pid`` from /proc, 0 if unavailable (e.g. not Linux, process gone)."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return 0
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+def track_pool(pool) -> None:
+    """Export an ExtractionPool's admission state and worker memory, read at scrape time."""
+    EXTRACTIONS_IN_FLIGHT.set_function(lambda: pool.in_flight)
+    QUEUE_DEPTH.set_function(lambda: pool.queue_depth)
+    WORKERS_RSS.set_function(lambda: sum(resident_bytes(pid) for pid in pool.worker_pids))
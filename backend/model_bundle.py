@@ -0,0 +1,318 @@
+# backend/model_bundle.py
+"""
+Versioned model bundles: everything needed to score, in one directory.
+
+    models/bundles/<version>/
+        manifest.json      format, version, model metadata, FEATURE_ORDER,
+                           SCALE_COLS, scaler mean/scale, genre classes, the
+                           golden prediction, and the size and SHA-256 of
+                           every other file
+        model.joblib       the fitted estimator
+        flat/<name>.npy    FlatForest arrays (tree ensembles only; max_depth
+                           is in the manifest)
+    models/bundles/CURRENT name of the bundle served by default
+
+The flat arrays are plain .npy files opened with ``mmap_mode="r"``, so
+loading a bundle maps them instead of copying or unpickling a forest, and
+a reload only swaps which files are mapped. The estimator itself is only
+unpickled when something needs it: models with no flat form, or batches
+larger than the flat engine's cutoff.
+
+Bundles are written to a temporary directory and renamed into place, and
+CURRENT is replaced last, so readers only ever see complete bundles.
+
+    python model_bundle.py build --models-dir models
+    python model_bundle.py verify
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+from typing import Optional
+
+import numpy as np
+
+from forest_engine import FlatForest, compile_forest
+from normalize_output import (
+    FEATURE_ORDER, MODELS_DIR, SCALE_COLS, FeatureNormalizer, normalizer_from_manifest,
+)
+
+BUNDLE_FORMAT = 1
+BUNDLES_DIR = os.environ.get("MODEL_BUNDLES_DIR", os.path.join(MODELS_DIR, "bundles"))
+# A specific bundle directory to serve instead of BUNDLES_DIR/CURRENT
+MODEL_BUNDLE = os.environ.get("MODEL_BUNDLE", "")
+# Check file checksums against the manifest on load
+MODEL_BUNDLE_VERIFY = os.environ.get("MODEL_BUNDLE_VERIFY", "1") == "1"
+
+# The flat engine is only bundled when it reproduces the estimator this closely
+FLAT_PARITY_TOL = 1e-9
+
+# A typical raw feature vector. Its score is recorded when a bundle is
+# written, and a server loading the bundle must reproduce it (GOLDEN_TOL)
+# before serving, which catches corrupt files and library drift.
+GOLDEN_FEATURES = {
+    "duration_ms": 210000, "explicit": 0, "danceability": 0.62, "key": 5, "loudness": -6.5,
+    "mode": 1, "speechiness": 0.05, "acousticness": 0.2, "instrumentalness": 0.0,
+    "liveness": 0.12, "valence": 0.5, "tempo": 118.0, "time_signature": 4, "track_genre": "pop",
+}
+GOLDEN_TOL = 1e-6
+
+class BundleError(RuntimeError):
+    """Missing, incomplete or corrupt bundle."""
+
+def model_key(name: str) -> str:
+    """Registry model name -> the key used for files and routing ("Random Forest" -> "random_forest")."""
+    return name.strip().lower().replace(" ", "_")
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _flat_parity(flat: FlatForest, model) -> float:
+    import pandas as pd
+
+    probe = pd.DataFrame(
+        np.random.default_rng(0).normal(size=(256, len(FEATURE_ORDER))), columns=FEATURE_ORDER
+    )
+    return flat.max_abs_diff(model, probe)
+
+def golden_prediction(model, normalizer: FeatureNormalizer) -> float:
+    import pandas as pd
+
+    X = normalizer.transform(normalizer.to_matrix([GOLDEN_FEATURES]))
+    return float(model.predict(pd.DataFrame(X, columns=FEATURE_ORDER))[0])
+
+# ------------------------- writing -------------------------
+def write_bundle(model, scaler, genre_encoder, bundles_dir: str = BUNDLES_DIR,
+                 meta: Optional[dict] = None, make_current: bool = True) -> str:
+    """
+    Write a bundle for a fitted model plus its scaler and genre encoder;
+    returns its directory. The version is derived from the content, so
+    rebuilding identical artifacts yields the same bundle.
+    """
+    import joblib
+
+    normalizer = FeatureNormalizer.from_fitted(scaler, genre_encoder)
+    os.makedirs(bundles_dir, exist_ok=True)
+    tmp = os.path.join(bundles_dir, f".tmp-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+    os.makedirs(os.path.join(tmp, "flat"))
+    try:
+        joblib.dump(model, os.path.join(tmp, "model.joblib"))
+        flat_info = None
+        try:
+            flat = compile_forest(model)
+        except TypeError:
+            flat = None
+        if flat is not None:
+            gap = _flat_parity(flat, model)
+            if gap <= FLAT_PARITY_TOL:
+                for name in FlatForest.ARRAYS:
+                    np.save(os.path.join(tmp, "flat", f"{name}.npy"),
+                            np.ascontiguousarray(getattr(flat, name)))
+                flat_info = {"max_depth": flat.max_depth, "n_trees": flat.n_trees,
+                             "n_nodes": flat.n_nodes, "max_abs_diff": gap}
+
+        files = {}
+        for root, _, names in os.walk(tmp):
+            for name in sorted(names):
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, tmp).replace(os.sep, "/")
+                files[rel] = {"bytes": os.path.getsize(path), "sha256": _sha256(path)}
+
+        manifest = {
+            "format": BUNDLE_FORMAT,
+            # Training metadata, minus its pointer to the standalone file
+            "model": {"class": type(model).__name__,
+                      **{k: v for k, v in (meta or {}).items() if k != "file"}},
+            "feature_order": FEATURE_ORDER,
+            "scale_cols": SCALE_COLS,
+            "scaler": {"mean": normalizer.mean.tolist(), "scale": normalizer.scale.tolist()},
+            "genres": normalizer.genres,
+            "flat": flat_info,
+            "golden": {"features": GOLDEN_FEATURES, "prediction": golden_prediction(model, normalizer)},
+            "files": dict(sorted(files.items())),
+        }
+        digest = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode()).hexdigest()
+        manifest["version"] = digest[:12]
+        manifest["created_at"] = time.time()
+        with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        final = os.path.join(bundles_dir, manifest["version"])
+        if os.path.isdir(final):
+            shutil.rmtree(tmp)  # identical content already there
+        else:
+            os.replace(tmp, final)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    if make_current:
+        set_current(manifest["version"], bundles_dir)
+    return final
+
+def set_current(version: str, bundles_dir: str = BUNDLES_DIR) -> None:
+    if not os.path.isfile(os.path.join(bundles_dir, version, "manifest.json")):
+        raise BundleError(f"No bundle {version} in {bundles_dir}")
+    pointer = os.path.join(bundles_dir, "CURRENT")
+    tmp = f"{pointer}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp, pointer)
+
+# ------------------------- reading -------------------------
+def current_bundle_path(bundles_dir: str = BUNDLES_DIR) -> Optional[str]:
+    """MODEL_BUNDLE if set, else the bundle CURRENT names; None if there is none."""
+    if MODEL_BUNDLE:
+        return MODEL_BUNDLE
+    try:
+        with open(os.path.join(bundles_dir, "CURRENT")) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(bundles_dir, version)
+
+def read_manifest(path: str) -> dict:
+    try:
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise BundleError(f"Unreadable bundle manifest in {path}: {e}")
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise BundleError(f"Unsupported bundle format {manifest.get('format')!r} in {path}")
+    return manifest
+
+def verify_bundle(path: str, manifest: dict) -> None:
+    for rel, info in manifest["files"].items():
+        file_path = os.path.join(path, rel)
+        if not os.path.isfile(file_path) or os.path.getsize(file_path) != info["bytes"]:
+            raise BundleError(f"Bundle file missing or truncated: {file_path}")
+        if _sha256(file_path) != info["sha256"]:
+            raise BundleError(f"Bundle file checksum mismatch: {file_path}")
+
+class ModelBundle:
+    """
+    A loaded bundle: normalizer and memory-mapped flat forest up front, the
+    estimator on first use of ``model``.
+    """
+
+    def __init__(self, path: str, manifest: dict, normalizer: FeatureNormalizer,
+                 flat: Optional[FlatForest] = None, model=None):
+        self.path = path
+        self.manifest = manifest
+        self.normalizer = normalizer
+        self.flat = flat
+        self._model = model
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> str:
+        return self.manifest["version"]
+
+    @property
+    def name(self) -> str:
+        """Routing key: the training model name, else the standalone file's stem."""
+        meta = self.manifest["model"]
+        if "model_name" in meta:
+            return model_key(meta["model_name"])
+        if "file" in meta:
+            return os.path.splitext(meta["file"])[0]
+        return model_key(meta["class"])
+
+    @property
+    def model(self):
+        if self._model is None:
+            import joblib
+
+            with self._lock:
+                if self._model is None:
+                    self._model = joblib.load(os.path.join(self.path, "model.joblib"))
+        return self._model
+
+    @classmethod
+    def load(cls, path: str, verify: bool = MODEL_BUNDLE_VERIFY) -> "ModelBundle":
+        manifest = read_manifest(path)
+        if verify:
+            verify_bundle(path, manifest)
+        try:
+            normalizer = normalizer_from_manifest(manifest)
+        except ValueError as e:
+            raise BundleError(f"{path}: {e}")
+        flat = None
+        if manifest.get("flat"):
+            # np.asarray drops the memmap subclass (cheaper indexing) but
+            # keeps the file mapping
+            flat = FlatForest(
+                max_depth=manifest["flat"]["max_depth"],
+                **{name: np.asarray(np.load(os.path.join(path, "flat", f"{name}.npy"), mmap_mode="r"))
+                   for name in FlatForest.ARRAYS},
+            )
+        return cls(path, manifest, normalizer, flat)
+
+    @classmethod
+    def from_joblib(cls, model_path: str, scaler_path: str, genre_encoder_path: str) -> "ModelBundle":
+        """In-memory bundle from standalone joblib files (no manifest checks, no flat arrays)."""
+        import joblib
+
+        normalizer = FeatureNormalizer.from_paths(scaler_path, genre_encoder_path)
+        model = joblib.load(model_path)
+        manifest = {"format": BUNDLE_FORMAT, "version": "unbundled",
+                    "model": {"class": type(model).__name__, "file": os.path.basename(model_path)},
+                    "flat": None}
+        return cls(os.path.dirname(model_path), manifest, normalizer, model=model)
+
+# ------------------------- CLI -------------------------
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Build or verify model bundles.")
+    sub = ap.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Bundle standalone joblib artifacts")
+    build.add_argument("--models-dir", default=MODELS_DIR)
+    build.add_argument("--model", default="random_forest.joblib")
+    build.add_argument("--bundles-dir", default=BUNDLES_DIR)
+    build.add_argument("--no-current", action="store_true", help="Do not point CURRENT at the new bundle")
+    verify = sub.add_parser("verify", help="Check a bundle against its manifest")
+    verify.add_argument("path", nargs="?", default=None, help="Bundle directory (default: current)")
+    args = ap.parse_args(argv)
+
+    if args.command == "build":
+        import joblib
+
+        model_path = os.path.join(args.models_dir, args.model)
+        meta_path = model_path[: -len(".joblib")] + ".meta.json"
+        meta = None
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        path = write_bundle(
+            joblib.load(model_path),
+            joblib.load(os.path.join(args.models_dir, "scaler.joblib")),
+            joblib.load(os.path.join(args.models_dir, "track_genre_encoder.joblib")),
+            args.bundles_dir, meta=meta, make_current=not args.no_current,
+        )
+        print(path)
+        return 0
+
+    path = args.path or current_bundle_path()
+    if path is None:
+        print("No current bundle", file=sys.stderr)
+        return 1
+    try:
+        manifest = read_manifest(path)
+        verify_bundle(path, manifest)
+    except BundleError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"{path}: version {manifest['version']}, {len(manifest['files'])} files OK")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,22 @@
+import os
+from functools import lru_cache
+
 import joblib
 import numpy as np
 import pandas as pd
 
 # --- artifacts you saved during training ---
-SCALER_PATH = "models/scaler.joblib"
-GENRE_ENCODER_PATH = "models/track_genre_encoder.joblib"
+# Anchored to this file so loading does not depend on the working directory
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+SCALER_PATH = os.path.join(MODELS_DIR, "scaler.joblib")
+GENRE_ENCODER_PATH = os.path.join(MODELS_DIR, "track_genre_encoder.joblib")
+
+# column order the model was trained on
+FEATURE_ORDER = [
+    "duration_ms", "explicit", "danceability", "key", "loudness", "mode",
+    "speechiness", "acousticness", "instrumentalness", "liveness", "valence",
+    "tempo", "time_signature", "track_genre"
+]
 
 # must match training
 SCALE_COLS = [
@@ -12,32 +24,123 @@ SCALE_COLS = [
     "acousticness", "instrumentalness", "liveness", "valence", "tempo",
 ]
 
-def normalize_song_features(raw_features: dict) -> dict:
-    # Load artifacts
-    scaler = joblib.load(SCALER_PATH)
-    le = joblib.load(GENRE_ENCODER_PATH)
+def _to_float(value) -> float:
+    """
+    Numeric coercion like ``pd.to_numeric(errors="coerce")``. Numbers pass
+    through unchanged; numeric strings are parsed correctly rounded, where
+    pandas' fast parser can be one ulp off.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
 
-    # Build a single-row DataFrame
-    df = pd.DataFrame([raw_features]).copy()
+class FeatureNormalizer:
+    """
+    Scaler and genre encoder loaded once and applied with plain array math.
 
-    # --- Label encode track_genre using the exact same encoder as training ---
-    # If an unseen genre appears, map to a safe default (first known class or 'other' if it exists).
-    try:
-        df["track_genre"] = le.transform(df["track_genre"])
-    except ValueError:
-        # unseen label; fall back
-        classes = list(le.classes_)
-        fallback = "other" if "other" in classes else classes[0]
-        mapping = {c: i for i, c in enumerate(classes)}
-        df["track_genre"] = df["track_genre"].map(lambda g: mapping.get(g, mapping[fallback])).astype(int)
+    The genre -> code mapping and the scaler's mean/scale vectors are
+    precomputed, and scaling is the same float64 subtract-then-divide that
+    ``StandardScaler.transform`` does, so results are bit-for-bit identical
+    to the per-call pandas path this replaces.
+    """
+
+    def __init__(self, genres, mean, scale):
+        classes = list(genres)
+        self.genres = classes
+        self.genre_codes = {c: i for i, c in enumerate(classes)}
+        # If an unseen genre appears, map to a safe default (first known class or 'other' if it exists).
+        fallback = "other" if "other" in self.genre_codes else classes[0]
+        self.fallback_code = self.genre_codes[fallback]
+
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.scale_idx = np.array([FEATURE_ORDER.index(c) for c in SCALE_COLS])
+        self.genre_idx = FEATURE_ORDER.index("track_genre")
+
+    @classmethod
+    def from_fitted(cls, scaler, genre_encoder):
+        """From a fitted StandardScaler (over SCALE_COLS) and LabelEncoder."""
+        n = len(SCALE_COLS)
+        mean = scaler.mean_ if scaler.with_mean else np.zeros(n)
+        scale = scaler.scale_ if scaler.with_std else np.ones(n)
+        return cls([str(c) for c in genre_encoder.classes_], mean, scale)
 
-    # Ensure correct dtypes for numeric fields (esp. if they came as strings)
-    for c in SCALE_COLS:
-        df[c] = pd.to_numeric(df[c], errors="coerce")
+    @classmethod
+    def from_paths(cls, scaler_path: str = SCALER_PATH, genre_encoder_path: str = GENRE_ENCODER_PATH):
+        return cls.from_fitted(joblib.load(scaler_path), joblib.load(genre_encoder_path))
 
-    # --- Normalize only the columns you scaled during training ---
-    df[SCALE_COLS] = scaler.transform(df[SCALE_COLS])
+    def same_encoding(self, other: "FeatureNormalizer") -> bool:
+        """True if both produce identical model inputs for any raw row."""
+        return (self.genres == other.genres and np.array_equal(self.mean, other.mean)
+                and np.array_equal(self.scale, other.scale))
 
-    # Return as a plain dict
-    return df.iloc[0].to_dict()
+    def encode_genre(self, genre) -> int:
+        return self.genre_codes.get(genre, self.fallback_code)
 
+    def to_matrix(self, rows) -> np.ndarray:
+        """Raw feature dicts -> unscaled (N, 14) float64 matrix in FEATURE_ORDER."""
+        X = np.empty((len(rows), len(FEATURE_ORDER)), dtype=np.float64)
+        for i, raw in enumerate(rows):
+            for j, col in enumerate(FEATURE_ORDER):
+                if j == self.genre_idx:
+                    X[i, j] = self.encode_genre(raw[col])
+                else:
+                    X[i, j] = _to_float(raw[col])
+        return X
+
+    def columns_to_matrix(self, columns) -> np.ndarray:
+        """
+        Vectorized ``to_matrix`` for column-oriented input: a mapping of
+        FEATURE_ORDER names to equal-length array-likes. Unparseable or
+        missing values become NaN; unknown genres get the fallback code.
+        """
+        n = len(columns[FEATURE_ORDER[0]])
+        X = np.empty((n, len(FEATURE_ORDER)), dtype=np.float64)
+        for j, col in enumerate(FEATURE_ORDER):
+            if j == self.genre_idx:
+                codes = pd.Categorical(columns[col], categories=self.genres).codes
+                X[:, j] = np.where(codes < 0, self.fallback_code, codes)
+            else:
+                X[:, j] = pd.to_numeric(pd.Series(columns[col]), errors="coerce").astype(np.float64)
+        return X
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        """Scale SCALE_COLS of a (14,) row or (N, 14) matrix; returns a new array."""
+        X = np.array(X, dtype=np.float64)
+        cols = X[..., self.scale_idx]
+        cols -= self.mean
+        cols /= self.scale
+        X[..., self.scale_idx] = cols
+        return X
+
+    def expand_genres(self, row: np.ndarray, genres) -> np.ndarray:
+        """One normalized row repeated per genre, differing only in ``track_genre``."""
+        X = np.tile(np.asarray(row, dtype=np.float64), (len(genres), 1))
+        X[:, self.genre_idx] = [self.encode_genre(g) for g in genres]
+        return X
+
+    def normalize(self, raw_features: dict) -> dict:
+        """Single feature dict in, normalized dict out (all values float)."""
+        row = self.transform(self.to_matrix([raw_features])[0])
+        by_col = dict(zip(FEATURE_ORDER, row.tolist()))
+        return {k: by_col[k] if k in by_col else _to_float(v) for k, v in raw_features.items()}
+
+@lru_cache(maxsize=1)
+def get_normalizer() -> FeatureNormalizer:
+    """Process-wide normalizer, loaded on first use: from the current model
+    bundle if there is one, else from the standalone joblib files."""
+    from model_bundle import current_bundle_path, read_manifest
+
+    path = current_bundle_path()
+    if path is not None:
+        return normalizer_from_manifest(read_manifest(path))
+    return FeatureNormalizer.from_paths()
+
+def normalizer_from_manifest(manifest: dict) -> FeatureNormalizer:
+    if manifest["feature_order"] != FEATURE_ORDER or manifest["scale_cols"] != SCALE_COLS:
+        raise ValueError("Model bundle was built for a different feature layout")
+    return FeatureNormalizer(manifest["genres"], manifest["scaler"]["mean"], manifest["scaler"]["scale"])
+
+def normalize_song_features(raw_features: dict) -> dict:
+    return get_normalizer().normalize(raw_features)
@@ -0,0 +1,118 @@
+# backend/shadow.py
+"""
+Shadow scoring: score the same normalized rows with other models after the
+response is ready, and track how far they disagree with the served one.
+
+Work goes to a small thread pool and is dropped (and counted) when too
+much is already pending, so shadows can never slow down or back up the
+primary path. Per-model running stats are logged every SHADOW_LOG_EVERY
+comparisons and exported as Prometheus metrics.
+"""
+from __future__ import annotations
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+
+import metrics
+
+SHADOW_WORKERS = int(os.environ.get("SHADOW_WORKERS", 1))
+SHADOW_MAX_PENDING = int(os.environ.get("SHADOW_MAX_PENDING", 64))
+SHADOW_LOG_EVERY = int(os.environ.get("SHADOW_LOG_EVERY", 100))
+
+logger = logging.getLogger(__name__)
+
+class DisagreementStats:
+    """Running |shadow - primary| statistics over scored rows."""
+
+    def __init__(self):
+        self.rows = 0
+        self.sum_abs = 0.0
+        self.sum_sq = 0.0
+        self.max_abs = 0.0
+        self.sum_seconds = 0.0
+        self.batches = 0
+
+    def add(self, diff: np.ndarray, seconds: float) -> None:
+        self.rows += diff.size
+        self.sum_abs += float(np.abs(diff).sum())
+        self.sum_sq += float(np.square(diff).sum())
+        self.max_abs = max(self.max_abs, float(np.abs(diff).max(initial=0.0)))
+        self.sum_seconds += seconds
+        self.batches += 1
+
+    def summary(self) -> dict:
+        n = max(self.rows, 1)
+        return {
+            "rows": self.rows,
+            "mean_abs_diff": self.sum_abs / n,
+            "rmse": math.sqrt(self.sum_sq / n),
+            "max_abs_diff": self.max_abs,
+            "mean_latency_ms": self.sum_seconds / max(self.batches, 1) * 1000.0,
+        }
+
+class ShadowScorer:
+    def __init__(self, workers: int = SHADOW_WORKERS, max_pending: int = SHADOW_MAX_PENDING,
+                 log_every: int = SHADOW_LOG_EVERY):
+        self.max_pending = max_pending
+        self.log_every = max(1, log_every)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shadow")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats: Dict[str, DisagreementStats] = {}
+
+    def submit(self, X: np.ndarray, primary: np.ndarray, primary_name: str, shadows: List) -> None:
+        """
+        Queue ``shadows`` (objects with ``name`` and ``predict``) to score
+        ``X``, whose served predictions were ``primary``. Returns at once.
+        """
+        if not shadows:
+            return
+        with self._lock:
+            if self._pending >= self.max_pending:
+                metrics.SHADOW_DROPPED.inc()
+                return
+            self._pending += 1
+        self._executor.submit(self._run, X, primary, primary_name, shadows)
+
+    def _run(self, X, primary, primary_name, shadows) -> None:
+        try:
+            for shadow in shadows:
+                t0 = time.perf_counter()
+                try:
+                    pred = np.clip(shadow.predict(X), 0.0, 100.0)
+                except Exception as e:
+                    logger.warning("Shadow model %s failed: %s", shadow.name, e)
+                    continue
+                seconds = time.perf_counter() - t0
+                diff = pred - primary
+                metrics.SHADOW_SECONDS.labels(shadow.name).observe(seconds)
+                for d in np.abs(diff).tolist():
+                    metrics.SHADOW_ABS_DIFF.labels(shadow.name).observe(d)
+                with self._lock:
+                    stats = self._stats.setdefault(f"{shadow.name} vs {primary_name}", DisagreementStats())
+                    before = stats.rows
+                    stats.add(diff, seconds)
+                    due = stats.rows // self.log_every > before // self.log_every
+                    summary = stats.summary() if due else None
+                if summary is not None:
+                    logger.info(
+                        "Shadow %s vs %s over %d rows: mean |diff| %.3f, rmse %.3f, max %.3f, %.2f ms/call",
+                        shadow.name, primary_name, summary["rows"], summary["mean_abs_diff"],
+                        summary["rmse"], summary["max_abs_diff"], summary["mean_latency_ms"],
+                    )
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {pair: s.summary() for pair, s in self._stats.items()}
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
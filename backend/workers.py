@@ -0,0 +1,202 @@
+# backend/workers.py
+"""Process pool for CPU-bound audio decoding and feature extraction."""
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from audio_io import AUDIO_RESAMPLER, TARGET_SR, decode_audio, header_duration, synthetic_clip
+from excerpt_features import EXCERPT_COUNT, EXCERPT_SECONDS, extract_heuristic_features_excerpts
+from extract_features import FEATURE_VERSION, QUALITY_TIERS, extract_heuristic_features, timed
+from job_store import JobStore
+from streaming_features import extract_heuristic_features_streaming
+
+# Worker processes (default: one per vCPU) and how many extra jobs may wait
+# for a free worker before new uploads are turned away with 503.
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", os.cpu_count() or 1))
+EXTRACT_MAX_QUEUE = int(os.environ.get("EXTRACT_MAX_QUEUE", 2 * EXTRACT_WORKERS))
+
+# Tracks at least this long (per the file header) are analyzed with the
+# bounded-memory streaming extractor; 0 disables streaming.
+STREAM_MIN_SECONDS = float(os.environ.get("STREAM_MIN_SECONDS", 600))
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(RuntimeError):
+    """Raised when every worker is busy and the wait queue is full."""
+
+class WorkerCrashedError(RuntimeError):
+    """Raised for jobs that were running when a worker died; the pool is restarted."""
+
+# Everything besides the audio bytes, quality tier and excerpt mode that
+# extract_job's output depends on
+EXTRACT_VARIANT = f"v{FEATURE_VERSION}-sr{TARGET_SR}"
+if AUDIO_RESAMPLER != "soxr_hq":
+    EXTRACT_VARIANT += f"-{AUDIO_RESAMPLER}"
+
+def extract_variant(quality: str = "full", excerpts: bool = False) -> str:
+    """Cache-key variant for one tier/mode (full-track "full" keeps the original key)."""
+    variant = EXTRACT_VARIANT if quality == "full" else f"{EXTRACT_VARIANT}-{quality}"
+    if excerpts:
+        variant += f"-x{EXCERPT_COUNT}x{EXCERPT_SECONDS:g}"
+    return variant
+
+_JOB_STORE: Optional[JobStore] = None
+
+def _report_stage(job_id: Optional[str], stage: str) -> None:
+    """Record a /jobs stage from inside the worker process."""
+    global _JOB_STORE
+    if job_id is None:
+        return
+    if _JOB_STORE is None:
+        _JOB_STORE = JobStore()
+    _JOB_STORE.set_stage(job_id, stage)
+
+def extract_job(
+    file_bytes: bytes, ext: str, quality: str = "full", excerpts: bool = False,
+    job_id: Optional[str] = None,
+) -> Tuple[dict, Dict[str, float]]:
+    """
+    Decode + extract in a worker process. Returns the genre-free raw feature
+    dict and seconds spent per stage ("decode", the FEATURE_STAGES groups,
+    or "stream" for the streaming extractor, which interleaves them).
+    For whole-track extraction of a /jobs upload, ``job_id``'s stage is set
+    to "decoded" between the two steps.
+    """
+    sr = TARGET_SR if quality == "full" else QUALITY_TIERS[quality]["sr"]
+    timings: Dict[str, float] = {}
+    if excerpts:
+        feats = extract_heuristic_features_excerpts(file_bytes, ext=ext, sr=sr, quality=quality, timings=timings)
+        feats.pop("track_genre")
+        return feats, timings
+
+    duration = header_duration(file_bytes) if STREAM_MIN_SECONDS > 0 else None
+    if duration is not None and duration >= STREAM_MIN_SECONDS:
+        with timed(timings, "stream"):
+            feats = extract_heuristic_features_streaming(file_bytes, sr=sr, quality=quality)
+    else:
+        with timed(timings, "decode"):
+            y = decode_audio(file_bytes, ext=ext, sr=sr)
+        _report_stage(job_id, "decoded")
+        feats = extract_heuristic_features(y, sr, quality=quality, timings=timings)
+    feats.pop("track_genre")
+    return feats, timings
+
+def _warm_job() -> int:
+    # Runs the whole extraction once so librosa's imports, numba JIT and
+    # filterbank caches are paid for at startup, not by the first upload.
+    extract_heuristic_features(synthetic_clip(), TARGET_SR)
+    return os.getpid()
+
+class ExtractionPool:
+    """
+    ProcessPoolExecutor with an admission limit, driven from the event loop.
+    Callers past the limit get QueueFullError, or with ``wait=True`` wait
+    for a slot in FIFO order.
+
+    A worker that dies (e.g. OOM-killed) breaks the whole executor; the
+    next ``run`` replaces it with a fresh, warmed one. ``healthy`` is False
+    while that happens or if it failed.
+    """
+
+    def __init__(self, max_workers: int = EXTRACT_WORKERS, max_queued: int = EXTRACT_MAX_QUEUE):
+        self.max_workers = max(1, max_workers)
+        self.max_queued = max(0, max_queued)
+        self.in_flight = 0
+        self.healthy = False
+        self.restarts = 0
+        self._executor: ProcessPoolExecutor | None = None
+        self._restart_lock = threading.Lock()
+        self._waiters: deque = deque()  # futures of run(wait=True) callers, oldest first
+
+    @property
+    def worker_pids(self) -> List[int]:
+        """PIDs of the live worker processes (empty before start)."""
+        if self._executor is None:
+            return []
+        # ProcessPoolExecutor has no public accessor for its processes
+        return list(getattr(self._executor, "_processes", None) or {})
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs admitted or waiting for admission, but not yet on a worker."""
+        return max(0, self.in_flight - self.max_workers) + len(self._waiters)
+
+    def start(self) -> None:
+        """Spawn and warm every worker; blocks until all of them are ready."""
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        # One concurrent warm job per worker forces the pool to spawn them all
+        futures = [self._executor.submit(_warm_job) for _ in range(self.max_workers)]
+        for f in futures:
+            f.result()
+        self.healthy = True
+
+    def shutdown(self) -> None:
+        self.healthy = False
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def _restart(self, broken: ProcessPoolExecutor) -> None:
+        """Replace ``broken`` with a fresh pool, unless another caller already did."""
+        with self._restart_lock:
+            if self._executor is not broken:
+                return
+            self.healthy = False
+            self.restarts += 1
+            logger.warning("Extraction worker died; restarting the pool (restart %d)", self.restarts)
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.start()
+
+    async def _acquire(self, wait: bool) -> None:
+        if self.in_flight < self.max_workers + self.max_queued:
+            self.in_flight += 1
+            return
+        if not wait:
+            raise QueueFullError(f"{self.in_flight} extraction jobs already in flight")
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()  # the slot was handed over just as we were cancelled
+            raise
+
+    def _release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # hand the slot straight to the oldest waiter
+                return
+        self.in_flight -= 1
+
+    async def run(self, fn, *args, wait: bool = False):
+        """Run ``fn(*args)`` in a worker without blocking the event loop."""
+        await self._acquire(wait)
+        try:
+            loop = asyncio.get_running_loop()
+            executor = self._executor
+            if executor is None:
+                # run_in_executor(None, ...) would quietly use the default thread pool
+                raise RuntimeError("Extraction pool is not running (not started or shut down)")
+            try:
+                future = loop.run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                # Broken before this job got in: restart, then submit it normally
+                await loop.run_in_executor(None, self._restart, executor)
+                executor = self._executor
+                future = loop.run_in_executor(executor, fn, *args)
+            try:
+                return await future
+            except BrokenProcessPool:
+                # This job may be what killed the worker, so it is not retried
+                await loop.run_in_executor(None, self._restart, executor)
+                raise WorkerCrashedError("Extraction worker died (out of memory?) while processing this file")
+        finally:
+            self._release()
@@ -0,0 +1,17 @@
+"""
+Benchmarks for the backend. Run from the repository root, e.g.
+
+    python -m benchmarks.forest_engine --model backend/models/random_forest.joblib
+    python -m benchmarks.corpus --durations 10s 1m
+    python -m benchmarks.suite --profile quick --output bench.json
+
+The suite compares against benchmarks/baseline.json when it exists; record
+one on the reference machine with ``--update-baseline``.
+"""
+import os
+import sys
+
+# backend/ is a flat directory of modules (app.py imports them by name)
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
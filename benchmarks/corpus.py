@@ -0,0 +1,147 @@
+"""
+Deterministic synthetic audio corpus for the benchmarks.
+
+Every signal is a pure function of time (plus a seeded RNG per block), so a
+file is identical on every machine and can be written block by block: even
+the 60-minute variants never hold more than BLOCK_SECONDS of audio in
+memory. Files are cached under CORPUS_DIR and regenerated only if missing.
+
+    python -m benchmarks.corpus --durations 10s 1m --extensions .wav .mp3
+"""
+from __future__ import annotations
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import zlib
+from typing import Callable, Dict, Iterable, List
+
+import numpy as np
+
+CORPUS_DIR = os.environ.get(
+    "BENCH_CORPUS_DIR", os.path.join(tempfile.gettempdir(), "song-popularity-corpus")
+)
+SAMPLE_RATE = 44100  # typical upload rate, so decoding also exercises resampling
+BLOCK_SECONDS = 10
+
+DURATIONS = {"10s": 10, "1m": 60, "10m": 600, "60m": 3600}
+# Same set as app.ALLOWED_EXTENSIONS
+EXTENSIONS = (".wav", ".flac", ".ogg", ".mp3", ".m4a", ".aac", ".wma")
+# Written by libsndfile; the rest are transcoded from the WAV with ffmpeg
+SOUNDFILE_FORMATS = {".wav": ("WAV", "PCM_16"), ".flac": ("FLAC", "PCM_16"),
+                     ".ogg": ("OGG", "VORBIS"), ".mp3": ("MP3", "MPEG_LAYER_III")}
+
+# ------------------------- signals -------------------------
+def _clicks(bpm: float):
+    def gen(t, rng):
+        pos = np.mod(t, 60.0 / bpm)
+        return 0.8 * np.exp(-pos / 0.01) * np.sin(2 * np.pi * 1000.0 * t)
+    return gen
+
+def _chords(root_hz: float, minor: bool):
+    third = 2 ** ((3 if minor else 4) / 12)
+    fifth = 2 ** (7 / 12)
+
+    def gen(t, rng):
+        # Tonic triad pulsing at 120 BPM, plus a little noise
+        y = sum(np.sin(2 * np.pi * root_hz * r * t) for r in (1.0, third, fifth, 2.0))
+        env = 0.6 + 0.4 * np.exp(-np.mod(t, 0.5) / 0.15)
+        return 0.15 * env * y + 0.01 * rng.standard_normal(t.size)
+    return gen
+
+def _noise(t, rng):
+    return 0.2 * rng.standard_normal(t.size)
+
+# (F1, F2) in Hz for a few vowels
+VOWELS = ((730, 1090), (270, 2290), (530, 1840), (570, 840), (300, 870))
+
+def _speech(t, rng):
+    # Glottal harmonics of a gliding f0, shaped by per-syllable vowel formants,
+    # four syllables per second with a pause every 2 s
+    f0 = 120.0 + 15.0 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * (120.0 * t - 15.0 / (2 * np.pi * 0.3) * np.cos(2 * np.pi * 0.3 * t))
+    syllable = np.floor(t * 4).astype(np.int64)
+    vowel = np.array(VOWELS)[(syllable * 2654435761) % len(VOWELS)]
+    y = np.zeros_like(t)
+    for k in range(1, 31):
+        fk = k * f0
+        amp = (np.exp(-((fk - vowel[:, 0]) / 120.0) ** 2)
+               + 0.6 * np.exp(-((fk - vowel[:, 1]) / 150.0) ** 2)) / k ** 0.5
+        y += amp * np.sin(k * phase)
+    env = np.sin(np.pi * np.mod(t * 4, 1.0)) ** 2 * (np.mod(t, 2.0) < 1.75)
+    return 0.3 * env * y + 0.005 * rng.standard_normal(t.size)
+
+SIGNALS: Dict[str, Callable] = {
+    "clicks-90bpm": _clicks(90.0),
+    "clicks-128bpm": _clicks(128.0),
+    "chords-c-major": _chords(261.63, minor=False),
+    "chords-a-minor": _chords(220.0, minor=True),
+    "noise": _noise,
+    "speech": _speech,
+}
+
+def blocks(signal: str, seconds: float, sr: int = SAMPLE_RATE) -> Iterable[np.ndarray]:
+    """float32 blocks of ``signal``; block i's noise is seeded by (signal, i)."""
+    gen = SIGNALS[signal]
+    n_total = int(seconds * sr)
+    step = BLOCK_SECONDS * sr
+    for i, start in enumerate(range(0, n_total, step)):
+        t = np.arange(start, min(start + step, n_total)) / sr
+        rng = np.random.default_rng([zlib.crc32(signal.encode()), i])
+        yield np.clip(gen(t, rng), -1.0, 1.0).astype(np.float32)
+
+# ------------------------- files -------------------------
+def corpus_path(signal: str, duration: str, ext: str, corpus_dir: str = CORPUS_DIR) -> str:
+    return os.path.join(corpus_dir, f"{signal}-{duration}{ext}")
+
+def ensure_file(signal: str, duration: str, ext: str, corpus_dir: str = CORPUS_DIR) -> str:
+    """Path of the corpus file, writing it first if needed. RuntimeError if ``ext`` needs a missing ffmpeg."""
+    import soundfile as sf
+
+    path = corpus_path(signal, duration, ext, corpus_dir)
+    if os.path.exists(path):
+        return path
+    os.makedirs(corpus_dir, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if ext in SOUNDFILE_FORMATS:
+        fmt, subtype = SOUNDFILE_FORMATS[ext]
+        with sf.SoundFile(tmp, "w", SAMPLE_RATE, 1, format=fmt, subtype=subtype) as f:
+            for block in blocks(signal, DURATIONS[duration]):
+                f.write(block)
+    else:
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise RuntimeError(f"ffmpeg is required to write {ext} files")
+        source = ensure_file(signal, duration, ".wav", corpus_dir)
+        fmt = {".m4a": "ipod", ".aac": "adts", ".wma": "asf"}[ext]
+        subprocess.run(
+            [ffmpeg, "-nostdin", "-loglevel", "error", "-y", "-i", source, "-f", fmt, tmp],
+            check=True,
+        )
+    os.replace(tmp, path)
+    return path
+
+def build(signals: List[str], durations: List[str], extensions: List[str],
+          corpus_dir: str = CORPUS_DIR) -> List[str]:
+    paths = []
+    for signal in signals:
+        for duration in durations:
+            for ext in extensions:
+                paths.append(ensure_file(signal, duration, ext, corpus_dir))
+    return paths
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Write the synthetic benchmark corpus.")
+    ap.add_argument("--signals", nargs="+", default=list(SIGNALS), choices=list(SIGNALS))
+    ap.add_argument("--durations", nargs="+", default=["10s", "1m"], choices=list(DURATIONS))
+    ap.add_argument("--extensions", nargs="+", default=list(EXTENSIONS), choices=list(EXTENSIONS))
+    ap.add_argument("--dir", default=CORPUS_DIR)
+    args = ap.parse_args(argv)
+    for path in build(args.signals, args.durations, args.extensions, args.dir):
+        print(f"{os.path.getsize(path) / 1e6:8.1f} MB  {path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Parity and latency of forest_engine.FlatForest against sklearn's predict.
+
+Fails (exit code 1) if any prediction differs from sklearn by more than
+--tol. Latency is reported as p50/p95 milliseconds per predict call.
+"""
+from __future__ import annotations
+import argparse
+import json
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from . import BACKEND_DIR  # noqa: F401  (puts backend/ on sys.path)
+from forest_engine import compile_forest
+from normalize_output import FEATURE_ORDER
+
+BATCH_SIZES = (1, 16, 114, 256, 1024)
+
+def probe_rows(n: int, seed: int = 0) -> pd.DataFrame:
+    """Normalized-looking feature rows: z-scores for scaled columns, codes for the rest."""
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size=(n, len(FEATURE_ORDER))), columns=FEATURE_ORDER)
+    X["explicit"] = rng.integers(0, 2, n)
+    X["key"] = rng.integers(0, 12, n)
+    X["mode"] = rng.integers(0, 2, n)
+    X["time_signature"] = rng.integers(3, 6, n)
+    X["track_genre"] = rng.integers(0, 114, n)
+    return X
+
+def time_calls(fn, repeats: int) -> dict:
+    fn()  # warm caches
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return {"p50_ms": float(np.percentile(samples, 50)), "p95_ms": float(np.percentile(samples, 95))}
+
+def run(model_path: str, repeats: int, tol: float) -> dict:
+    model = joblib.load(model_path)
+    t0 = time.perf_counter()
+    flat = compile_forest(model)
+    compile_s = time.perf_counter() - t0
+
+    X = probe_rows(max(BATCH_SIZES) * 4)
+    gap = flat.max_abs_diff(model, X)
+
+    report = {
+        "model": model_path,
+        "trees": flat.n_trees,
+        "nodes": flat.n_nodes,
+        "max_depth": flat.max_depth,
+        "flat_bytes": flat.nbytes,
+        "compile_s": compile_s,
+        "max_abs_diff": gap,
+        "parity_ok": gap <= tol,
+        "latency": [],
+    }
+    for n in BATCH_SIZES:
+        rows = X.iloc[:n]
+        arr = rows.to_numpy()
+        report["latency"].append({
+            "rows": n,
+            "sklearn": time_calls(lambda: model.predict(rows), repeats),
+            "flat": time_calls(lambda: flat.predict(arr), repeats),
+        })
+    return report
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--model", default=f"{BACKEND_DIR}/models/random_forest.joblib")
+    ap.add_argument("--repeats", type=int, default=50)
+    ap.add_argument("--tol", type=float, default=1e-9)
+    ap.add_argument("--json", help="also write the report to this file")
+    args = ap.parse_args(argv)
+
+    report = run(args.model, args.repeats, args.tol)
+    print(f"{report['trees']} trees, {report['nodes']} nodes, depth {report['max_depth']}, "
+          f"{report['flat_bytes'] / 1e6:.1f} MB flat, compiled in {report['compile_s']:.2f}s")
+    print(f"max |flat - sklearn| = {report['max_abs_diff']:.3g} (tol {args.tol:g})")
+    print(f"{'rows':>6} {'sklearn p50':>12} {'flat p50':>10} {'sklearn p95':>12} {'flat p95':>10}")
+    for r in report["latency"]:
+        print(f"{r['rows']:>6} {r['sklearn']['p50_ms']:>10.2f}ms {r['flat']['p50_ms']:>8.2f}ms "
+              f"{r['sklearn']['p95_ms']:>10.2f}ms {r['flat']['p95_ms']:>8.2f}ms")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["parity_ok"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
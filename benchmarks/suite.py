@@ -0,0 +1,341 @@
+"""
+Latency and peak-memory benchmarks over the synthetic corpus, with
+regression checks against a stored baseline.
+
+Benchmarks extract_heuristic_features_from_audio per corpus file,
+FeatureNormalizer.normalize (what normalize_song_features calls), model
+predict, and end-to-end /predict_file against a local uvicorn server.
+Results go to a JSON file. With a baseline, the run fails (exit code 1)
+when a case's p50 latency or peak memory grows past the allowed ratio.
+
+    python -m benchmarks.suite --profile quick --output bench.json
+    python -m benchmarks.suite --profile quick --update-baseline
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import BACKEND_DIR
+from .corpus import CORPUS_DIR, EXTENSIONS, SIGNALS, ensure_file
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# (signal, duration, extension) cases per profile: every signal at the
+# shortest duration, one signal in every extension, then longer tracks
+def profile_cases(profile: str) -> List[Tuple[str, str, str]]:
+    cases = [(s, "10s", ".wav") for s in SIGNALS]
+    cases += [("chords-a-minor", "10s", ext) for ext in EXTENSIONS if ext != ".wav"]
+    if profile in ("standard", "full"):
+        cases += [(s, "1m", ".wav") for s in SIGNALS]
+        cases += [("chords-a-minor", "10m", ".mp3")]
+    if profile == "full":
+        cases += [("chords-a-minor", "10m", ".wav"), ("speech", "10m", ".flac")]
+        cases += [("chords-a-minor", "60m", ".mp3"), ("chords-a-minor", "60m", ".flac")]
+    return cases
+
+# ------------------------- measurement -------------------------
+def percentiles(samples_ms: List[float]) -> dict:
+    return {
+        "p50_ms": float(np.percentile(samples_ms, 50)),
+        "p95_ms": float(np.percentile(samples_ms, 95)),
+        "runs": len(samples_ms),
+    }
+
+def measure(fn, repeats: int, warmup: int = 1) -> dict:
+    """Latency percentiles over ``repeats`` calls, then one traced call for peak heap (MB)."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    # Traced separately: tracemalloc slows allocation-heavy code
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {**percentiles(samples), "peak_mb": peak / 1e6}
+
+def bench_extract(cases, repeats: int, corpus_dir: str, quality: str) -> Dict[str, dict]:
+    from extract_features import extract_heuristic_features_from_audio
+
+    results = {}
+    for signal, duration, ext in cases:
+        name = f"extract/{quality}/{signal}-{duration}{ext}"
+        try:
+            path = ensure_file(signal, duration, ext, corpus_dir)
+        except RuntimeError as e:
+            results[name] = {"skipped": str(e)}
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+        long_track = duration not in ("10s", "1m")
+        results[name] = measure(
+            lambda: extract_heuristic_features_from_audio(data, quality=quality),
+            repeats=1 if long_track else repeats,
+            warmup=0 if long_track else 1,
+        )
+        print(f"{name:<48} {results[name]['p50_ms']:>10.1f} ms {results[name]['peak_mb']:>8.1f} MB")
+    return results
+
+def sample_features(seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    return {
+        "duration_ms": int(rng.integers(60_000, 400_000)), "explicit": 0,
+        "danceability": rng.random(), "key": int(rng.integers(0, 12)),
+        "loudness": -rng.random() * 30, "mode": 1, "speechiness": rng.random(),
+        "acousticness": rng.random(), "instrumentalness": rng.random(),
+        "liveness": rng.random(), "valence": rng.random(), "tempo": 60 + rng.random() * 120,
+        "time_signature": 4, "track_genre": "pop",
+    }
+
+def bench_model(models_dir: str, repeats: int) -> Dict[str, dict]:
+    import joblib
+    import pandas as pd
+    from normalize_output import FEATURE_ORDER, FeatureNormalizer
+
+    normalizer = FeatureNormalizer.from_paths(
+        os.path.join(models_dir, "scaler.joblib"),
+        os.path.join(models_dir, "track_genre_encoder.joblib"),
+    )
+    model = joblib.load(os.path.join(models_dir, "random_forest.joblib"))
+    feats = sample_features()
+
+    results = {"normalize/1": measure(lambda: normalizer.normalize(feats), repeats)}
+    row = normalizer.transform(normalizer.to_matrix([feats]))
+    for n in (1, 114):
+        X = pd.DataFrame(np.repeat(row, n, axis=0), columns=FEATURE_ORDER)
+        results[f"predict/{n}"] = measure(lambda: model.predict(X), repeats)
+    for name, r in results.items():
+        print(f"{name:<48} {r['p50_ms']:>10.3f} ms {r['peak_mb']:>8.3f} MB")
+    return results
+
+# ------------------------- end to end -------------------------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _tree_peak_rss_mb(pid: int) -> Optional[float]:
+    """Summed VmHWM of ``pid`` and its child processes (Linux /proc only)."""
+    def hwm(p):
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return 0
+
+    def children(p):
+        kids = []
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # ppid is the second field after the parenthesized command
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            if ppid == p:
+                kids.append(int(entry))
+        return kids
+
+    if not os.path.exists(f"/proc/{pid}"):
+        return None
+    pids, total = [pid], 0
+    while pids:
+        p = pids.pop()
+        total += hwm(p)
+        pids.extend(children(p))
+    return total / 1e6
+
+def start_server(backend_dir: str, timeout: float):
+    """uvicorn app:app on a free port with the feature cache off; (process, base URL)."""
+    port = _free_port()
+    env = dict(os.environ, FEATURE_CACHE_ENTRIES="0", FEATURE_CACHE_DIR="")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=backend_dir, env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    wait_ready(url, timeout, proc)
+    return proc, url
+
+def wait_ready(url: str, timeout: float, proc=None) -> None:
+    import requests
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            if requests.get(f"{url}/ready", timeout=2).status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"server not ready after {timeout:.0f}s")
+
+def bench_e2e(cases, repeats: int, corpus_dir: str, url: Optional[str],
+              backend_dir: str, timeout: float) -> Dict[str, dict]:
+    import requests
+
+    proc = None
+    if url is None:
+        proc, url = start_server(backend_dir, timeout)
+    else:
+        wait_ready(url, timeout)
+    results = {}
+    try:
+        with requests.Session() as session:
+            for signal, duration, ext in cases:
+                name = f"e2e/predict_file/{signal}-{duration}{ext}"
+                try:
+                    path = ensure_file(signal, duration, ext, corpus_dir)
+                except RuntimeError as e:
+                    results[name] = {"skipped": str(e)}
+                    continue
+                with open(path, "rb") as f:
+                    data = f.read()
+
+                def call():
+                    r = session.post(
+                        f"{url}/predict_file",
+                        files={"file": (os.path.basename(path), data)},
+                        data={"track_genre": "pop"},
+                        timeout=timeout,
+                    )
+                    r.raise_for_status()
+
+                call()  # warm-up
+                samples = []
+                for _ in range(repeats if duration in ("10s", "1m") else 1):
+                    t0 = time.perf_counter()
+                    call()
+                    samples.append((time.perf_counter() - t0) * 1000.0)
+                results[name] = percentiles(samples)
+                print(f"{name:<48} {results[name]['p50_ms']:>10.1f} ms")
+        if proc is not None:
+            peak = _tree_peak_rss_mb(proc.pid)
+            if peak is not None:
+                results["e2e/server"] = {"peak_mb": peak}
+                print(f"{'e2e/server peak RSS':<48} {peak:>22.1f} MB")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    return results
+
+# ------------------------- baseline -------------------------
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], max_slowdown: float,
+            max_memory_growth: float, min_delta_ms: float, min_delta_mb: float) -> List[str]:
+    """Regressions of ``results`` against ``baseline``; small absolute changes are ignored as noise."""
+    failures = []
+    for name, base in baseline.items():
+        cur = results.get(name)
+        if cur is None or "skipped" in cur or "skipped" in base:
+            continue
+        if "p50_ms" in base and "p50_ms" in cur:
+            b, c = base["p50_ms"], cur["p50_ms"]
+            if c > b * max_slowdown and c - b > min_delta_ms:
+                failures.append(f"{name}: p50 {c:.1f} ms vs baseline {b:.1f} ms ({c / b:.2f}x)")
+        if "peak_mb" in base and "peak_mb" in cur:
+            b, c = base["peak_mb"], cur["peak_mb"]
+            if c > b * max_memory_growth and c - b > min_delta_mb:
+                failures.append(f"{name}: peak {c:.1f} MB vs baseline {b:.1f} MB ({c / max(b, 1e-9):.2f}x)")
+    return failures
+
+def environment() -> dict:
+    try:
+        rev = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(BACKEND_DIR),
+        ).stdout.strip() or None
+    except OSError:
+        rev = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_rev": rev,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--profile", choices=("quick", "standard", "full"), default="quick")
+    ap.add_argument("--only", nargs="+", choices=("extract", "model", "e2e"),
+                    default=["extract", "model", "e2e"])
+    ap.add_argument("--quality", default="full", help="extraction quality tier")
+    ap.add_argument("--repeats", type=int, default=5, help="runs per extraction / e2e case")
+    ap.add_argument("--model-repeats", type=int, default=200)
+    ap.add_argument("--models-dir", default=os.path.join(BACKEND_DIR, "models"))
+    ap.add_argument("--corpus-dir", default=CORPUS_DIR)
+    ap.add_argument("--url", help="benchmark this running server instead of starting one")
+    ap.add_argument("--server-timeout", type=float, default=300.0)
+    ap.add_argument("--output", help="write results JSON here")
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--update-baseline", action="store_true",
+                    help="store these results as the new baseline instead of comparing")
+    ap.add_argument("--max-slowdown", type=float, default=1.25)
+    ap.add_argument("--max-memory-growth", type=float, default=1.25)
+    ap.add_argument("--min-delta-ms", type=float, default=5.0)
+    ap.add_argument("--min-delta-mb", type=float, default=5.0)
+    args = ap.parse_args(argv)
+
+    cases = profile_cases(args.profile)
+    results: Dict[str, dict] = {}
+    if "extract" in args.only:
+        results.update(bench_extract(cases, args.repeats, args.corpus_dir, args.quality))
+    if "model" in args.only:
+        results.update(bench_model(args.models_dir, args.model_repeats))
+    if "e2e" in args.only:
+        results.update(bench_e2e(cases, args.repeats, args.corpus_dir, args.url,
+                                 BACKEND_DIR, args.server_timeout))
+
+    report = {"environment": environment(), "profile": args.profile, "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    failures = compare(results, baseline, args.max_slowdown, args.max_memory_growth,
+                       args.min_delta_ms, args.min_delta_mb)
+    for line in failures:
+        print(f"REGRESSION {line}")
+    if not failures:
+        print(f"no regressions against {args.baseline}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+st.set_page_config(page_title="Batch Scoring | Music Popularity Predictor", page_icon="🎧", layout="wide")
+
+API_BASE = "https://song-predictor-800986629929.asia-south1.run.app"
+PREDICT_URL = f"{API_BASE}/predict_file"
+# Uploads in flight at once; the backend queues extraction and answers 503
+# (with Retry-After) when its queue is full, so more would only wait there
+MAX_CONCURRENCY = 8
+REQUEST_TIMEOUT = (10, 600)
+EXTENSIONS = ["wav", "mp3", "m4a", "flac", "aac", "ogg", "wma"]  # backend ALLOWED_EXTENSIONS
+GENRES = ["pop", "rock", "hip-hop", "electronic", "j-pop", "classical", "acoustic"]
+
+@st.cache_resource
+def http_session() -> requests.Session:
+    """Keep-alive session sized for MAX_CONCURRENCY parallel uploads."""
+    session = requests.Session()
+    # A 503 means the upload was turned away before any work was done, so
+    # it is safe to re-post after the server's Retry-After
+    retry = Retry(total=5, status_forcelist=(503,), allowed_methods=frozenset({"POST"}),
+                  respect_retry_after_header=True, backoff_factor=1.0)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCURRENCY, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def score_file(session: requests.Session, name: str, data: bytes, genre: str, excerpts: bool) -> dict:
+    """One /predict_file round trip; runs on a pool thread, so no st.* calls here."""
+    start = time.perf_counter()
+    row = {"file": name, "popularity": None, "latency_s": None, "status": "ok"}
+    try:
+        r = session.post(
+            PREDICT_URL,
+            files={"file": (name, data, "application/octet-stream")},
+            data={"track_genre": genre, "excerpts": str(excerpts).lower()},
+            timeout=REQUEST_TIMEOUT,
+        )
+        if r.status_code == 200:
+            row["popularity"] = r.json()["popularity_rounded"]
+        else:
+            row["status"] = f"{r.status_code} - {r.text}"
+    except requests.RequestException as e:
+        row["status"] = f"error - {e}"
+    row["latency_s"] = round(time.perf_counter() - start, 2)
+    return row
+
+def show_results(placeholder, rows: list) -> None:
+    df = pd.DataFrame(rows, columns=["file", "popularity", "latency_s", "status"])
+    placeholder.dataframe(
+        df,
+        hide_index=True,
+        column_config={
+            "popularity": st.column_config.ProgressColumn("Popularity", min_value=0, max_value=100, format="%d"),
+            "latency_s": st.column_config.NumberColumn("Latency (s)", format="%.2f"),
+        },
+    )
+
+st.title("🎧 Batch Scoring")
+st.caption("Score a whole folder of demos at once. Click a column header to sort the results.")
+
+uploaded_files = st.file_uploader(
+    "Upload your songs",
+    type=EXTENSIONS,
+    accept_multiple_files=True,
+    help=f"Supported formats: {', '.join('.' + e for e in EXTENSIONS)}",
+)
+genre = st.selectbox("Select genre", GENRES)
+excerpts = st.checkbox(
+    "Score representative excerpts", value=True,
+    help="Analyzes a few windows of each track instead of the whole file; much faster for long tracks.",
+)
+
+table = st.empty()
+
+if uploaded_files and st.button(f"Score {len(uploaded_files)} file(s)"):
+    rows = []
+    progress_bar = st.progress(0, text="Uploading...")
+    session = http_session()
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as pool:
+        futures = [
+            pool.submit(score_file, session, f.name, f.getvalue(), genre, excerpts)
+            for f in uploaded_files
+        ]
+        # Rows are added in completion order, so fast files show up first
+        for done, future in enumerate(as_completed(futures), start=1):
+            rows.append(future.result())
+            show_results(table, rows)
+            progress_bar.progress(done / len(futures), text=f"{done}/{len(futures)} scored")
+    st.session_state["batch_results"] = rows
+
+elif st.session_state.get("batch_results"):
+    # Keep the last run on screen across reruns
+    show_results(table, st.session_state["batch_results"])
@@ -1,8 +1,11 @@
 # frontend/streamlit_app.py
 import streamlit as st
 import requests
-import os
+import hashlib
+import time
 import plotly.graph_objects as go
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 st.set_page_config(
     page_title="🎵 Music Popularity Predictor",
@@ -36,59 +39,116 @@ genre = st.selectbox(
     ["pop", "rock", "hip-hop", "electronic", "j-pop", "classical", "acoustic"]
 )
 
-API_URL = "https://song-predictor-800986629929.asia-south1.run.app/predict_file"
+API_BASE = "https://song-predictor-800986629929.asia-south1.run.app"
+JOBS_URL = f"{API_BASE}/jobs"
+POLL_SECONDS = 1.0
+# Give up on a job that hasn't finished in this long
+JOB_TIMEOUT_SECONDS = 10 * 60
+# (connect, read) seconds; the upload itself can take a while on slow links
+REQUEST_TIMEOUT = (10, 120)
+# Keep cached scores well inside the backend's job TTL (24 h by default)
+RESULT_TTL_SECONDS = 6 * 3600
+
+STAGE_TEXT = {
+    "queued": "Waiting for a worker...",
+    "received": "Decoding audio...",
+    "decoded": "Extracting features...",
+    "features": "Predicting popularity...",
+    "predicted": "Done!",
+}
+
+@st.cache_resource
+def http_session() -> requests.Session:
+    """One keep-alive session shared by all reruns and users, so the TLS
+    handshake to the backend happens once rather than on every request."""
+    session = requests.Session()
+    # Only polling is retried: re-posting an upload would start a second job
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                  allowed_methods=frozenset({"GET"}))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=16, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def job_json(r: requests.Response) -> dict:
+    if r.status_code not in (200, 202):
+        raise RuntimeError(f"{r.status_code} - {r.text}")
+    return r.json()
+
+@st.cache_data(ttl=RESULT_TTL_SECONDS, max_entries=256, show_spinner=False)
+def predict(file_hash: str, genre: str, _file_bytes: bytes, _filename: str) -> dict:
+    """Backend result for an upload, cached by content hash and genre.
+
+    The bytes are posted straight from memory. The progress bar is created
+    here because cached functions may only touch their own elements; on a
+    cache hit Streamlit replays it in its finished state.
+    """
+    session = http_session()
+    progress_bar = st.progress(30, text="Sending request to backend...")
+    job = job_json(session.post(
+        JOBS_URL,
+        files={"file": (_filename, _file_bytes, "audio/mpeg")},
+        data={"track_genre": genre},
+        timeout=REQUEST_TIMEOUT,
+    ))
+
+    # The backend answers at once with a job id; poll it for real
+    # progress instead of holding one request open for the analysis
+    deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
+    while job["status"] in ("queued", "running"):
+        progress_bar.progress(
+            30 + int(70 * job["progress"]), text=STAGE_TEXT.get(job["stage"], job["stage"])
+        )
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"No result after {JOB_TIMEOUT_SECONDS // 60} minutes; please try again")
+        time.sleep(POLL_SECONDS)
+        r = session.get(f"{JOBS_URL}/{job['id']}", timeout=REQUEST_TIMEOUT)
+        if r.status_code == 404:
+            # Expired, or the backend restarted without its job store
+            raise RuntimeError("The backend lost track of this job; please try again")
+        job = job_json(r)
+
+    if job["status"] == "failed":
+        raise RuntimeError(job["error"])
+    if job["status"] != "done":
+        raise RuntimeError(f"Unexpected job status from the backend: {job['status']!r}")
+    progress_bar.progress(100, text="Done!")
+    return job["result"]
 
 if uploaded_file:
     # Display audio player
     st.audio(uploaded_file, format="audio/mp3")
 
-    # Predict button
-    if st.button("Predict Popularity"):
-        progress_bar = st.progress(0, text="Uploading file...")
-        status_text = st.empty()
+    file_bytes = uploaded_file.getvalue()
+    prediction_key = (hashlib.sha256(file_bytes).hexdigest(), genre)
 
-        tmp_file_path = "temp_upload.mp3"
-        with open(tmp_file_path, "wb") as f:
-            f.write(uploaded_file.read())
-        progress_bar.progress(30, text="File uploaded")
+    # Keep showing the last score across reruns (widget changes, etc.); the
+    # cache makes that free, and a new file or genre needs a new click
+    if st.button("Predict Popularity"):
+        st.session_state["prediction_key"] = prediction_key
 
+    if st.session_state.get("prediction_key") == prediction_key:
         try:
-            with open(tmp_file_path, "rb") as f:
-                files = {"file": (os.path.basename(tmp_file_path), f, "audio/mpeg")}
-                data = {"track_genre": genre}
-                status_text.text("Sending request to backend...")
-                r = requests.post(API_URL, files=files, data=data)
-            progress_bar.progress(70, text="Processing...")
-
-            if r.status_code == 200:
-                result = r.json()
-                popularity = result.get("popularity_rounded", 0)
-                progress_bar.progress(100, text="Done!")
-
-                # --- Display metric card ---
-                st.metric(label="🎵 Predicted Popularity", value=f"{popularity}/100")
-
-                # --- Interactive Plotly gauge chart ---
-                fig = go.Figure(go.Indicator(
-                    mode="gauge+number",
-                    value=popularity,
-                    title={'text': "Popularity Score"},
-                    gauge={'axis': {'range': [0, 100]},
-                           'bar': {'color': "#4CAF50"},
-                           'steps': [
-                               {'range': [0, 50], 'color': "#FF6347"},
-                               {'range': [50, 75], 'color': "#FFD700"},
-                               {'range': [75, 100], 'color': "#4CAF50"}]}
-                ))
-                fig.update_layout(height=400)
-                st.plotly_chart(fig, use_container_width=True)
-
-            else:
-                st.error(f"Prediction failed: {r.status_code} - {r.text}")
-
+            result = predict(*prediction_key, file_bytes, uploaded_file.name)
         except Exception as e:
-            st.error(f"Error: {e}")
-
-        finally:
-            if os.path.exists(tmp_file_path):
-                os.remove(tmp_file_path)
+            st.error(f"Prediction failed: {e}")
+        else:
+            popularity = result.get("popularity_rounded", 0)
+
+            # --- Display metric card ---
+            st.metric(label="🎵 Predicted Popularity", value=f"{popularity}/100")
+
+            # --- Interactive Plotly gauge chart ---
+            fig = go.Figure(go.Indicator(
+                mode="gauge+number",
+                value=popularity,
+                title={'text': "Popularity Score"},
+                gauge={'axis': {'range': [0, 100]},
+                       'bar': {'color': "#4CAF50"},
+                       'steps': [
+                           {'range': [0, 50], 'color': "#FF6347"},
+                           {'range': [50, 75], 'color': "#FFD700"},
+                           {'range': [75, 100], 'color': "#4CAF50"}]}
+            ))
+            fig.update_layout(height=400)
+            st.plotly_chart(fig, use_container_width=True)
@@ -0,0 +1,19 @@
+"""
+Tests for the backend and training code. Run from the repository root:
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+
+# backend/ is a flat directory of modules (app.py imports them by name);
+# the root makes the training and benchmarks packages importable
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT_DIR, "backend")
+for path in (ROOT_DIR, BACKEND_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Importing app opens the /jobs store; keep test jobs out of the real one
+os.environ.setdefault("JOB_DIR", tempfile.mkdtemp(prefix="song-popularity-test-jobs-"))
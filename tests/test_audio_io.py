@@ -0,0 +1,30 @@
+import os
+
+import pytest
+
+import audio_io
+from audio_io import DecodeError, decode_audio, encode_wav, synthetic_clip
+
+GARBAGE = os.urandom(4096)
+
+@pytest.mark.parametrize("ext", [".mp3", ".m4a", ".wav"])
+@pytest.mark.parametrize("ffmpeg", [True, False])
+def test_undecodable_upload_raises_decode_error(monkeypatch, ext, ffmpeg):
+    if not ffmpeg:
+        monkeypatch.setattr(audio_io, "FFMPEG_BIN", "no-such-ffmpeg")
+    with pytest.raises(DecodeError, match="Could not decode the .* as audio: .+"):
+        decode_audio(GARBAGE, ext=ext)
+
+def test_valid_upload_still_decodes():
+    y = decode_audio(encode_wav(synthetic_clip(1.0)), ext=".wav")
+    assert len(y) == audio_io.TARGET_SR
+
+def test_hung_ffmpeg_times_out(monkeypatch, tmp_path):
+    fake = tmp_path / "ffmpeg"
+    fake.write_text("#!/bin/sh\nsleep 30\n")
+    fake.chmod(0o755)
+    monkeypatch.setattr(audio_io, "FFMPEG_BIN", str(fake))
+    monkeypatch.setattr(audio_io, "FFMPEG_TIMEOUT_SECONDS", 0.5)
+    monkeypatch.setattr(audio_io, "FFMPEG_TIMEOUT_PER_MB", 0.0)
+    with pytest.raises(DecodeError, match="timed out"):
+        decode_audio(GARBAGE, ext=".m4a")
@@ -0,0 +1,40 @@
+import shutil
+import subprocess
+
+import pytest
+
+import audio_io
+from excerpt_features import EXCERPT_COUNT, EXCERPT_SECONDS, extract_heuristic_features_excerpts
+
+pytestmark = pytest.mark.skipif(shutil.which(audio_io.FFMPEG_BIN) is None, reason="needs ffmpeg")
+
+TRACK_SECONDS = 120
+
+@pytest.fixture(scope="module")
+def long_m4a(tmp_path_factory):
+    path = tmp_path_factory.mktemp("audio") / "long.m4a"
+    subprocess.run(
+        [audio_io.FFMPEG_BIN, "-nostdin", "-loglevel", "error", "-f", "lavfi",
+         "-i", f"sine=frequency=440:duration={TRACK_SECONDS}", "-c:a", "aac", str(path)],
+        check=True,
+    )
+    return path.read_bytes()
+
+def test_compressed_excerpts_decode_only_the_windows(monkeypatch, long_m4a):
+    calls = []
+    run = subprocess.run
+
+    def recording_run(cmd, *args, **kwargs):
+        calls.append(cmd)
+        return run(cmd, *args, **kwargs)
+
+    monkeypatch.setattr(audio_io.subprocess, "run", recording_run)
+    feats = extract_heuristic_features_excerpts(long_m4a, ext=".m4a")
+
+    decodes = [cmd for cmd in calls if "pipe:1" in cmd]
+    assert len(decodes) == EXCERPT_COUNT
+    for cmd in decodes:
+        # Input-side seek and limit: ffmpeg never decodes outside the window
+        assert cmd.index("-ss") < cmd.index("-i")
+        assert float(cmd[cmd.index("-t") + 1]) == pytest.approx(EXCERPT_SECONDS)
+    assert feats["duration_ms"] == pytest.approx(TRACK_SECONDS * 1000, abs=100)
@@ -0,0 +1,31 @@
+import json
+
+from feature_cache import FEATURE_CACHE_DISK_LOW_WATER, FeatureCache
+
+FEATS = {"danceability": 0.5, "tempo": 120.0, "loudness": -6.0}
+
+def key(i: int) -> str:
+    return f"{i:064d}"
+
+def test_disk_eviction_is_amortised(tmp_path, monkeypatch):
+    entry = len(json.dumps(FEATS).encode("utf-8"))
+    cache = FeatureCache(max_entries=0, disk_dir=str(tmp_path), disk_max_bytes=100 * entry)
+    scans = 0
+    entries = cache._disk_entries
+
+    def counting_entries():
+        nonlocal scans
+        scans += 1
+        return entries()
+
+    monkeypatch.setattr(cache, "_disk_entries", counting_entries)
+    for i in range(300):
+        cache.put(key(i), FEATS)
+        assert cache.stats()["disk_bytes"] <= cache.disk_max_bytes
+
+    # Each eviction frees ~10% of the budget (10 entries), not just one
+    assert scans <= 200 // 10 + 1
+    assert cache.stats()["disk_bytes"] >= FEATURE_CACHE_DISK_LOW_WATER * cache.disk_max_bytes - entry
+    # The newest entries survive, the oldest are gone
+    assert cache.get(key(299)) == FEATS
+    assert cache.get(key(0)) is None
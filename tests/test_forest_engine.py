@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+import app
+from forest_engine import compile_forest
+from normalize_output import FEATURE_ORDER
+
+TOL = 1e-9
+
+@pytest.fixture(scope="module", params=[False, True], ids=["dense", "with-nan"])
+def forest(request):
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(2000, len(FEATURE_ORDER))), columns=FEATURE_ORDER)
+    if request.param:
+        X = X.mask(rng.random(X.shape) < 0.05)
+    y = X["danceability"].fillna(0) * 10 + rng.normal(size=len(X))
+    rf = RandomForestRegressor(n_estimators=20, max_depth=10, random_state=0).fit(X, y)
+    return rf, compile_forest(rf), X
+
+def probe(X: pd.DataFrame, n: int) -> pd.DataFrame:
+    return X.sample(n=n, replace=True, random_state=n)
+
+@pytest.mark.parametrize("n", [1, 7, 256])
+def test_flat_forest_matches_sklearn(forest, n):
+    rf, flat, X = forest
+    rows = probe(X, n)
+    assert np.allclose(flat.predict(rows.to_numpy()), rf.predict(rows), rtol=0, atol=TOL)
+
+def test_single_row_as_1d_vector(forest):
+    rf, flat, X = forest
+    row = X.iloc[:1]
+    assert np.allclose(flat.predict(row.to_numpy()[0]), rf.predict(row), rtol=0, atol=TOL)
+
+@pytest.mark.parametrize("offset", [0, 1])
+def test_model_state_cutover_matches_sklearn(forest, offset):
+    # FOREST_FLAT_MAX_ROWS rows use the flat engine, one more uses sklearn
+    rf, flat, X = forest
+    state = app.ModelState(SimpleNamespace(model=rf, normalizer=None), None, flat)
+    rows = probe(X, app.FOREST_FLAT_MAX_ROWS + offset)
+    assert np.allclose(state.predict(rows.to_numpy()), rf.predict(rows), rtol=0, atol=TOL)
@@ -0,0 +1,16 @@
+from fastapi.testclient import TestClient
+
+import app
+
+def test_create_job_is_refused_once_the_queue_is_full(monkeypatch):
+    monkeypatch.setattr(app, "JOB_MAX_QUEUED", 1)
+    client = TestClient(app.app)  # no lifespan, so nothing takes jobs off the queue
+    upload = {"file": ("demo.wav", b"RIFF", "audio/wav")}
+
+    first = client.post("/jobs", files=upload, data={"track_genre": "pop"})
+    assert first.status_code == 202
+    assert first.json()["status"] == "queued"
+
+    second = client.post("/jobs", files=upload, data={"track_genre": "pop"})
+    assert second.status_code == 503
+    assert second.headers["Retry-After"] == "30"
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+from normalize_output import FEATURE_ORDER, SCALE_COLS, FeatureNormalizer
+
+GENRES = ["acoustic", "pop", "rock"]
+
+RAW = {
+    "duration_ms": 215733, "explicit": False, "danceability": 0.712, "key": 5,
+    "loudness": -6.351, "mode": 1, "speechiness": 0.0412, "acousticness": 0.0964,
+    "instrumentalness": 1.27e-05, "liveness": 0.118, "valence": 0.553,
+    "tempo": 117.9891, "time_signature": 4, "track_genre": "pop",
+}
+
+@pytest.fixture(scope="module")
+def fitted():
+    rng = np.random.default_rng(0)
+    train = pd.DataFrame(rng.normal(size=(500, len(SCALE_COLS))) * 7.3 + 1.1, columns=SCALE_COLS)
+    return StandardScaler().fit(train), LabelEncoder().fit(GENRES)
+
+def legacy_normalize(raw_features: dict, scaler, le) -> dict:
+    """The per-request pandas path FeatureNormalizer replaced, verbatim apart from the loading."""
+    df = pd.DataFrame([raw_features]).copy()
+    try:
+        df["track_genre"] = le.transform(df["track_genre"])
+    except ValueError:
+        classes = list(le.classes_)
+        fallback = "other" if "other" in classes else classes[0]
+        mapping = {c: i for i, c in enumerate(classes)}
+        df["track_genre"] = df["track_genre"].map(lambda g: mapping.get(g, mapping[fallback])).astype(int)
+    for c in SCALE_COLS:
+        df[c] = pd.to_numeric(df[c], errors="coerce")
+    df[SCALE_COLS] = scaler.transform(df[SCALE_COLS])
+    return df.iloc[0].to_dict()
+
+@pytest.mark.parametrize("genre", ["pop", "metal"], ids=["known-genre", "unseen-genre"])
+def test_numeric_input_is_bit_for_bit_identical(fitted, genre):
+    scaler, le = fitted
+    raw = dict(RAW, track_genre=genre)
+    new = FeatureNormalizer.from_fitted(scaler, le).normalize(raw)
+    old = legacy_normalize(raw, scaler, le)
+    assert list(new) == FEATURE_ORDER
+    for col in FEATURE_ORDER:
+        assert new[col] == float(old[col]), col
+
+def test_string_numeric_input_is_within_one_ulp_of_parsing(fitted):
+    # Strings are parsed correctly rounded; pandas' fast parser may be one
+    # ulp off, which scaling turns into at most ulp(x) / scale
+    scaler, le = fitted
+    raw = {k: (str(v) if k in SCALE_COLS else v) for k, v in RAW.items()}
+    raw["tempo"] = "117.98910000000000764"
+    new = FeatureNormalizer.from_fitted(scaler, le).normalize(raw)
+    old = legacy_normalize(raw, scaler, le)
+    for col in FEATURE_ORDER:
+        if col in SCALE_COLS:
+            scale = scaler.scale_[SCALE_COLS.index(col)]
+            tol = np.spacing(abs(float(raw[col]))) / scale + np.spacing(abs(new[col]))
+            assert abs(new[col] - old[col]) <= tol, col
+        else:
+            assert new[col] == float(old[col]), col
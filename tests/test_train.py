@@ -0,0 +1,27 @@
+import pandas as pd
+
+from normalize_output import FEATURE_ORDER
+from training.train import clean
+
+def _row(**overrides):
+    row = {
+        "Unnamed: 0": 0, "track_id": "a", "artists": "x", "album_name": "y", "track_name": "z",
+        "popularity": 50, "duration_ms": 200000, "explicit": False, "danceability": 0.5,
+        "energy": 0.5, "key": 1, "loudness": -5.0, "mode": 1, "speechiness": 0.05,
+        "acousticness": 0.1, "instrumentalness": 0.0, "liveness": 0.1, "valence": 0.5,
+        "tempo": 120.0, "time_signature": 4, "track_genre": "pop",
+    }
+    row.update(overrides)
+    return row
+
+def test_clean_deduplicates_before_dropping_energy_like_the_notebook():
+    df = pd.DataFrame([
+        _row(),
+        _row(**{"Unnamed: 0": 1, "track_id": "b"}),  # duplicate once identifiers are gone
+        _row(**{"Unnamed: 0": 2}, energy=0.9),        # differs only in energy: kept
+        _row(**{"Unnamed: 0": 3}, track_name=None),   # missing metadata: dropped
+    ])
+    out = clean(df)
+    assert len(out) == 2
+    assert list(out.columns) == FEATURE_ORDER + ["popularity"]
+    assert out["explicit"].tolist() == [0, 0]
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import signal
+import time
+
+import pytest
+
+from workers import ExtractionPool, QueueFullError, WorkerCrashedError
+
+@pytest.fixture
+def pool():
+    pool = ExtractionPool(max_workers=1, max_queued=0)
+    pool.start()
+    yield pool
+    pool.shutdown()
+
+def test_pool_recovers_after_worker_is_killed(pool):
+    (dead,) = pool.worker_pids
+    os.kill(dead, signal.SIGKILL)
+    # Let the executor notice the dead worker
+    deadline = time.monotonic() + 10
+    while not pool._executor._broken:
+        assert time.monotonic() < deadline, "executor never noticed the killed worker"
+        time.sleep(0.01)
+
+    pid = asyncio.run(pool.run(os.getpid))
+    assert pid != dead
+    assert pool.healthy
+    assert pool.restarts == 1
+    # and it keeps working afterwards
+    assert asyncio.run(pool.run(os.getpid)) == pid
+
+def test_run_refuses_a_pool_that_is_not_running():
+    pool = ExtractionPool(max_workers=1, max_queued=0)
+    with pytest.raises(RuntimeError, match="not running"):
+        asyncio.run(pool.run(os.getpid))
+    assert pool.in_flight == 0
+
+def _die():
+    os.kill(os.getpid(), signal.SIGKILL)
+
+def test_job_that_kills_its_worker_fails_alone(pool):
+    with pytest.raises(WorkerCrashedError):
+        asyncio.run(pool.run(_die))
+    assert pool.healthy
+    assert asyncio.run(pool.run(os.getpid)) in pool.worker_pids
+
+def test_waiting_callers_are_admitted_in_order(pool):
+    async def main():
+        order = []
+
+        async def job(i):
+            await pool.run(time.sleep, 0.2, wait=True)
+            order.append(i)
+
+        tasks = [asyncio.create_task(job(i)) for i in range(3)]
+        await asyncio.sleep(0.05)
+        assert pool.queue_depth == 2
+        with pytest.raises(QueueFullError):
+            await pool.run(os.getpid)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(main()) == [0, 1, 2]
+    assert pool.in_flight == 0
@@ -0,0 +1,15 @@
+"""
+Model training. Run from the repository root, e.g.
+
+    python -m training.train --data dataset.csv --out backend/models
+
+song_popularity.py is the original exploratory notebook; train.py is the
+reproducible pipeline that writes the artifacts the backend serves.
+"""
+import os
+import sys
+
+# backend/ is a flat directory of modules; training shares its feature order
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
@@ -0,0 +1,470 @@
+"""
+Reproducible training pipeline for the popularity models.
+
+Same preprocessing and candidates as the song_popularity notebook, as a
+CLI: the cleaned dataset is cached as Parquet keyed by a hash of the input
+CSV (so re-runs skip parsing and cleaning), candidates train concurrently
+on threads (sklearn's tree builders and BLAS release the GIL, and fitted
+forests are not pickled back from worker processes), and every artifact is
+written atomically with registry.json last, so a reader never sees a
+registry that points at missing or half-written files.
+
+Each saved model is also profiled for serving: single-row and 256-row
+predict latency, file size, and load time and resident memory in a fresh
+process. The registry marks the Pareto front of r2 against latency and
+the model selected under an optional latency budget. Every model is also
+written as a model bundle (see backend/model_bundle.py) and the selected
+one becomes the current bundle, which is what the backend serves by
+default; the others can be routed to or shadow-scored by name.
+
+``--distill`` adds a "Distilled Forest": a small student (histogram
+gradient boosting or a shallow forest) fit to the random forest's
+predictions on real plus augmented rows, saved and profiled like any other
+candidate, with its fidelity to the forest recorded.
+
+    python -m training.train --data dataset.csv --out backend/models
+    python -m training.train --data dataset.csv --models "Random Forest" --n-jobs 8
+    python -m training.train --data dataset.csv --latency-budget-ms 2 --r2-tolerance 0.01
+    python -m training.train --data dataset.csv --distill hgb
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.ensemble import GradientBoostingRegressor, HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.linear_model import LinearRegression, Ridge
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.model_selection import train_test_split
+from sklearn.neural_network import MLPRegressor
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+from threadpoolctl import threadpool_limits
+
+from . import BACKEND_DIR
+from model_bundle import write_bundle
+from normalize_output import FEATURE_ORDER, SCALE_COLS
+
+CACHE_DIR = os.environ.get(
+    "TRAIN_CACHE_DIR", os.path.join(tempfile.gettempdir(), "song-popularity-train")
+)
+# Bump when clean() changes so stale Parquet caches are not reused
+PREPROCESS_VERSION = 2
+
+TARGET = "popularity"
+REQUIRED_COLUMNS = ["track_genre", "track_name", "album_name", "artists"]
+DROP_COLUMNS = ["Unnamed: 0", "artists", "track_name", "album_name", "track_id"]
+# Dropped after deduplication, as in the notebook: highly correlated with loudness
+REDUNDANT_COLUMNS = ["energy"]
+
+def _candidates(seed: int, n_jobs: int) -> Dict[str, Callable]:
+    """Model name -> factory; the notebook's five candidates plus HistGradientBoosting."""
+    return {
+        "Linear Regression": lambda: LinearRegression(),
+        "Ridge Regression": lambda: Ridge(alpha=1.0),
+        "Random Forest": lambda: RandomForestRegressor(n_estimators=100, random_state=seed, n_jobs=n_jobs),
+        "Gradient Boosting": lambda: GradientBoostingRegressor(n_estimators=100, random_state=seed),
+        "Neural Network": lambda: MLPRegressor(hidden_layer_sizes=(64, 32), max_iter=200, random_state=seed),
+        "Hist Gradient Boosting": lambda: HistGradientBoostingRegressor(random_state=seed),
+    }
+
+CANDIDATES = list(_candidates(42, 1))
+
+# ------------------------- timing -------------------------
+@contextmanager
+def stage(timings: Dict[str, float], name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start
+        print(f"[{name}] {timings[name]:.2f}s", file=sys.stderr)
+
+# ------------------------- data -------------------------
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def clean(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The notebook's cleaning, in its order: drop rows missing metadata,
+    identifier columns, duplicates, then redundant columns (so rows that
+    differ only there are kept). ``explicit`` becomes 0/1 and
+    ``track_genre`` a categorical with sorted categories, so its codes are
+    exactly what LabelEncoder would assign.
+    """
+    df = df.dropna(subset=REQUIRED_COLUMNS)
+    df = df.drop(columns=[c for c in DROP_COLUMNS if c in df.columns])
+    df = df.drop_duplicates()
+    df = df.drop(columns=[c for c in REDUNDANT_COLUMNS if c in df.columns])
+    df = df.astype({"explicit": int})
+    df["track_genre"] = pd.Categorical(df["track_genre"], categories=sorted(df["track_genre"].unique()))
+    return df[FEATURE_ORDER + [TARGET]].reset_index(drop=True)
+
+def load_dataset(path: str, cache_dir: str = CACHE_DIR) -> pd.DataFrame:
+    """Cleaned dataset for the CSV at ``path``, from the Parquet cache when present."""
+    key = f"{file_digest(path)[:16]}-v{PREPROCESS_VERSION}"
+    cache_path = os.path.join(cache_dir, f"dataset-{key}.parquet")
+    if os.path.exists(cache_path):
+        print(f"Using cached dataset {cache_path}", file=sys.stderr)
+        return pd.read_parquet(cache_path)
+
+    df = clean(pd.read_csv(path))
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{cache_path}.{os.getpid()}.tmp"
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, cache_path)
+    return df
+
+def encode(df: pd.DataFrame):
+    """
+    Fit the genre encoder and scaler and return (X, y, scaler, encoder).
+    Like the notebook (and the served scaler), the scaler is fit on the
+    whole dataset before the train/test split.
+    """
+    encoder = LabelEncoder().fit(np.asarray(df["track_genre"].cat.categories))
+    X = df[FEATURE_ORDER].copy()
+    X["track_genre"] = df["track_genre"].cat.codes.astype(np.int64)
+    scaler = StandardScaler()
+    X[SCALE_COLS] = scaler.fit_transform(X[SCALE_COLS])
+    return X, df[TARGET], scaler, encoder
+
+# ------------------------- training -------------------------
+def _metrics(y_true, y_pred) -> Dict[str, float]:
+    return {
+        "rmse": float(np.sqrt(mean_squared_error(y_true, y_pred))),
+        "mae": float(mean_absolute_error(y_true, y_pred)),
+        "r2": float(r2_score(y_true, y_pred)),
+    }
+
+def fit_and_score(name: str, factory: Callable, X_train, y_train, X_test, y_test) -> dict:
+    start = time.perf_counter()
+    model = factory().fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+    return {"name": name, "model": model, "fit_seconds": fit_seconds,
+            "metrics": _metrics(y_test, model.predict(X_test))}
+
+def train_all(names: List[str], split, seed: int, n_jobs: int) -> List[dict]:
+    """
+    Fit the named candidates concurrently; results in ``names`` order.
+    ``n_jobs`` is split between the two levels: models fit side by side,
+    and each gets the remainder for its own threads (estimator ``n_jobs``
+    plus native OpenMP/BLAS pools), so no more than ``n_jobs`` run at once.
+    """
+    X_train, X_test, y_train, y_test = split
+    outer = max(1, min(len(names), n_jobs))
+    inner = max(1, n_jobs // outer)
+    factories = _candidates(seed, inner)
+    with threadpool_limits(limits=inner):
+        return Parallel(n_jobs=outer, prefer="threads")(
+            delayed(fit_and_score)(name, factories[name], X_train, y_train, X_test, y_test)
+            for name in names
+        )
+
+# ------------------------- distillation -------------------------
+TEACHER = "Random Forest"
+DISTILLED = "Distilled Forest"
+# Categorical/integer features are resampled rather than jittered
+DISCRETE_COLS = [c for c in FEATURE_ORDER if c not in SCALE_COLS]
+
+def _students(seed: int, n_jobs: int) -> Dict[str, Callable]:
+    return {
+        "hgb": lambda: HistGradientBoostingRegressor(max_iter=300, max_leaf_nodes=63, random_state=seed),
+        "forest": lambda: RandomForestRegressor(n_estimators=16, max_depth=12, random_state=seed, n_jobs=n_jobs),
+    }
+
+STUDENTS = list(_students(42, 1))
+
+def augment(X: pd.DataFrame, n: int, rng: np.random.Generator,
+            noise: float = 0.1, swap_prob: float = 0.2) -> pd.DataFrame:
+    """
+    ``n`` synthetic rows near the real ones: sampled rows get Gaussian
+    jitter of ``noise`` standard deviations on the continuous (scaled)
+    features, and each discrete feature is swapped for another row's value
+    with probability ``swap_prob``.
+    """
+    base = X.iloc[rng.integers(0, len(X), n)].reset_index(drop=True)
+    out = base.copy()
+    out[SCALE_COLS] = base[SCALE_COLS].to_numpy() + rng.normal(
+        0.0, noise * X[SCALE_COLS].std(ddof=0).to_numpy(), size=(n, len(SCALE_COLS))
+    )
+    for col in DISCRETE_COLS:
+        swap = rng.random(n) < swap_prob
+        out.loc[swap, col] = X[col].to_numpy()[rng.integers(0, len(X), int(swap.sum()))]
+    return out
+
+def distill(teacher: dict, split, student: str, augment_ratio: float, seed: int, n_jobs: int) -> dict:
+    """
+    Fit a compact ``student`` on the teacher's predictions over the training
+    rows plus ``augment_ratio`` times as many augmented rows. Scored like the
+    other candidates, plus fidelity (rmse/r2 against the teacher) on the
+    test rows.
+    """
+    X_train, X_test, y_train, y_test = split
+    rng = np.random.default_rng(seed)
+    X_aug = pd.concat([X_train, augment(X_train, int(len(X_train) * augment_ratio), rng)],
+                      ignore_index=True)
+    y_soft = teacher["model"].predict(X_aug)
+
+    start = time.perf_counter()
+    model = _students(seed, n_jobs)[student]().fit(X_aug, y_soft)
+    fit_seconds = time.perf_counter() - start
+
+    pred = model.predict(X_test)
+    fidelity = _metrics(teacher["model"].predict(X_test), pred)
+    return {
+        "name": DISTILLED, "model": model, "fit_seconds": fit_seconds,
+        "metrics": _metrics(y_test, pred),
+        "distillation": {
+            "teacher": teacher["name"], "student": student, "augment_ratio": augment_ratio,
+            "n_samples": len(X_aug),
+            "fidelity_rmse": fidelity["rmse"], "fidelity_r2": fidelity["r2"],
+        },
+    }
+
+# ------------------------- profiling -------------------------
+# Rows per batch the latency profile times; 256 matches the backend's
+# FOREST_FLAT_MAX_ROWS batch cutoff
+PROFILE_BATCHES = {"predict_1_ms": 1, "predict_256_ms": 256}
+PROFILE_SECONDS = 0.5   # time budget per latency measurement
+LATENCY_METRICS = list(PROFILE_BATCHES)
+
+# Cold load in a fresh interpreter: imports happen before the baseline RSS
+# reading so only the model itself is counted
+_LOAD_PROBE = """
+import json, os, sys, time
+import joblib, numpy, pandas, sklearn.ensemble, sklearn.linear_model, sklearn.neural_network
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+before = rss()
+t0 = time.perf_counter()
+model = joblib.load(sys.argv[1])
+load_ms = (time.perf_counter() - t0) * 1000.0
+print(json.dumps({"load_ms": load_ms, "memory_bytes": rss() - before}))
+"""
+
+def predict_latency_ms(model, X: pd.DataFrame) -> float:
+    """Median wall time of ``model.predict(X)`` over PROFILE_SECONDS (at least 5 calls)."""
+    model.predict(X)  # warm-up
+    samples = []
+    deadline = time.perf_counter() + PROFILE_SECONDS
+    while len(samples) < 5 or time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        model.predict(X)
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return float(np.median(samples))
+
+def load_profile(path: str) -> Dict[str, float]:
+    """Load time and resident-memory growth of loading ``path`` in a fresh process."""
+    try:
+        out = subprocess.run([sys.executable, "-c", _LOAD_PROBE, path],
+                             check=True, capture_output=True, text=True).stdout
+        return json.loads(out)
+    except (subprocess.CalledProcessError, ValueError) as e:
+        print(f"Load profile of {path} failed: {e}", file=sys.stderr)
+        return {"load_ms": None, "memory_bytes": None}
+
+def profile_model(model, path: str, X_sample: pd.DataFrame) -> Dict[str, float]:
+    """Serving costs of a saved model. Profiles run one at a time so they do not skew each other."""
+    profile = {name: round(predict_latency_ms(model, X_sample.iloc[:n]), 4)
+               for name, n in PROFILE_BATCHES.items()}
+    profile["size_bytes"] = os.path.getsize(path)
+    profile.update(load_profile(path))
+    return profile
+
+# ------------------------- selection -------------------------
+def pareto_front(entries: List[dict], metric: str) -> List[dict]:
+    """Entries not dominated on (higher r2, lower ``metric`` latency)."""
+    def dominates(a, b):
+        ra, rb = a["metrics"]["r2"], b["metrics"]["r2"]
+        la, lb = a["profile"][metric], b["profile"][metric]
+        return ra >= rb and la <= lb and (ra > rb or la < lb)
+    return [e for e in entries if not any(dominates(o, e) for o in entries if o is not e)]
+
+def select_model(entries: List[dict], metric: str = "predict_1_ms",
+                 budget_ms: Optional[float] = None, r2_tolerance: float = 0.0) -> Optional[dict]:
+    """
+    Pick from the Pareto front: among models within ``budget_ms``, the
+    fastest whose r2 is within ``r2_tolerance`` of the best one. None if no
+    model fits the budget.
+    """
+    fits = [e for e in pareto_front(entries, metric)
+            if budget_ms is None or e["profile"][metric] <= budget_ms]
+    if not fits:
+        return None
+    best_r2 = max(e["metrics"]["r2"] for e in fits)
+    near = [e for e in fits if e["metrics"]["r2"] >= best_r2 - r2_tolerance]
+    return min(near, key=lambda e: e["profile"][metric])
+
+# ------------------------- artifacts -------------------------
+def _safe(name: str) -> str:
+    return name.lower().replace(" ", "_")
+
+def _atomic(path: str, write: Callable[[str], None]) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def _write_json(path: str, obj) -> None:
+    def write(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(obj, f, indent=2)
+    _atomic(path, write)
+
+def save_models(out_dir: str, results: List[dict], scaler, encoder) -> None:
+    """Model, scaler and encoder files; sets each result's ``file``."""
+    os.makedirs(out_dir, exist_ok=True)
+    _atomic(os.path.join(out_dir, "scaler.joblib"), lambda tmp: joblib.dump(scaler, tmp))
+    _atomic(os.path.join(out_dir, "track_genre_encoder.joblib"), lambda tmp: joblib.dump(encoder, tmp))
+    for r in results:
+        model = r["model"]
+        # Training threads should not carry over to serving, where a
+        # single-row predict is slower when fanned out
+        if "n_jobs" in model.get_params():
+            model.set_params(n_jobs=None)
+        r["file"] = f"{_safe(r['name'])}.joblib"
+        _atomic(os.path.join(out_dir, r["file"]), lambda tmp: joblib.dump(model, tmp))
+
+def build_registry(results: List[dict], metric: str,
+                   budget_ms: Optional[float], r2_tolerance: float) -> List[dict]:
+    """Registry entries in ``results`` order, with the Pareto front and selection marked."""
+    registry = [
+        {
+            "model_name": r["name"],
+            "file": r["file"],
+            "framework": "scikit-learn",
+            "type": "regression",
+            "features": FEATURE_ORDER,
+            "target": TARGET,
+            "metrics": r["metrics"],
+            "profile": r["profile"],
+            "fit_seconds": round(r["fit_seconds"], 3),
+            **({"distillation": r["distillation"]} if "distillation" in r else {}),
+        }
+        for r in results
+    ]
+    front = pareto_front(registry, metric)
+    chosen = select_model(registry, metric, budget_ms, r2_tolerance)
+    for meta in registry:
+        meta["pareto"] = any(meta is e for e in front)
+        meta["selected"] = meta is chosen
+        if chosen is not None:
+            meta["selection"] = {"latency_metric": metric, "budget_ms": budget_ms,
+                                 "r2_tolerance": r2_tolerance}
+    return registry
+
+def write_bundles(out_dir: str, results: List[dict], registry: List[dict], scaler, encoder) -> None:
+    """
+    A bundle per model, so the backend can serve or shadow any of them;
+    the selected one becomes current. Sets each entry's ``bundle`` version.
+    """
+    bundles_dir = os.path.join(out_dir, "bundles")
+    for r, meta in zip(results, registry):
+        path = write_bundle(r["model"], scaler, encoder, bundles_dir, meta=meta,
+                            make_current=meta["selected"])
+        meta["bundle"] = os.path.basename(path)
+
+def write_registry(out_dir: str, registry: List[dict]) -> None:
+    """Per-model .meta.json, then registry.json."""
+    for meta in registry:
+        _write_json(os.path.join(out_dir, f"{_safe(meta['model_name'])}.meta.json"), meta)
+    _write_json(os.path.join(out_dir, "registry.json"), registry)
+
+# ------------------------- CLI -------------------------
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Train the popularity models and write their artifacts.")
+    ap.add_argument("--data", required=True, help="Spotify tracks CSV (the notebook's dataset.csv)")
+    ap.add_argument("--out", default=os.path.join(BACKEND_DIR, "models"))
+    ap.add_argument("--models", nargs="+", default=CANDIDATES, choices=CANDIDATES, metavar="NAME",
+                    help=f"Candidates to train (default: all of {', '.join(CANDIDATES)})")
+    ap.add_argument("--n-jobs", type=int, default=os.cpu_count() or 1,
+                    help="Thread budget, split between candidates trained at once and each model's own threads")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--test-size", type=float, default=0.2)
+    ap.add_argument("--cache-dir", default=CACHE_DIR)
+    ap.add_argument("--distill", choices=STUDENTS, default=None,
+                    help=f"Also distill the {TEACHER} (must be among --models) into a compact student")
+    ap.add_argument("--augment-ratio", type=float, default=1.0,
+                    help="Augmented rows per training row for distillation")
+    ap.add_argument("--latency-metric", default="predict_1_ms", choices=LATENCY_METRICS,
+                    help="Latency the selection trades off against r2")
+    ap.add_argument("--latency-budget-ms", type=float, default=None,
+                    help="Only select models at most this slow (default: no budget)")
+    ap.add_argument("--r2-tolerance", type=float, default=0.0,
+                    help="Prefer a faster model whose r2 is within this of the best (e.g. 0.01)")
+    args = ap.parse_args(argv)
+    if args.distill and TEACHER not in args.models:
+        ap.error(f"--distill needs {TEACHER!r} in --models")
+
+    timings: Dict[str, float] = {}
+    total = time.perf_counter()
+    with stage(timings, "load"):
+        df = load_dataset(args.data, args.cache_dir)
+    with stage(timings, "encode"):
+        X, y, scaler, encoder = encode(df)
+        split = train_test_split(X, y, test_size=args.test_size, random_state=args.seed)
+    with stage(timings, "train"):
+        results = train_all(args.models, split, args.seed, args.n_jobs)
+    if args.distill:
+        with stage(timings, "distill"):
+            teacher = next(r for r in results if r["name"] == TEACHER)
+            results.append(distill(teacher, split, args.distill, args.augment_ratio, args.seed, args.n_jobs))
+    with stage(timings, "save"):
+        save_models(args.out, results, scaler, encoder)
+    with stage(timings, "profile"):
+        X_sample = X.sample(n=max(PROFILE_BATCHES.values()), replace=len(X) < 256, random_state=args.seed)
+        for r in results:
+            r["profile"] = profile_model(r["model"], os.path.join(args.out, r["file"]), X_sample)
+    registry = build_registry(results, args.latency_metric, args.latency_budget_ms, args.r2_tolerance)
+    with stage(timings, "bundle"):
+        write_bundles(args.out, results, registry, scaler, encoder)
+    with stage(timings, "registry"):
+        write_registry(args.out, registry)
+    timings["total"] = time.perf_counter() - total
+
+    print(f"\n{'model':<24} {'rmse':>7} {'r2':>6} {'1 row ms':>9} {'256 ms':>8} "
+          f"{'size MB':>8} {'load ms':>8} {'rss MB':>7} {'fit s':>7}")
+    for meta in sorted(registry, key=lambda m: -m["metrics"]["r2"]):
+        m, p = meta["metrics"], meta["profile"]
+        mark = "*" if meta["selected"] else ("p" if meta["pareto"] else " ")
+        print(f"{mark} {meta['model_name']:<22} {m['rmse']:7.3f} {m['r2']:6.3f} "
+              f"{p['predict_1_ms']:9.3f} {p['predict_256_ms']:8.3f} {p['size_bytes'] / 1e6:8.2f} "
+              f"{p['load_ms'] or 0:8.1f} {(p['memory_bytes'] or 0) / 1e6:7.1f} {meta['fit_seconds']:7.2f}")
+    for meta in registry:
+        if "distillation" in meta:
+            d = meta["distillation"]
+            print(f"{meta['model_name']}: {d['student']} on {d['n_samples']} rows, "
+                  f"fidelity to {d['teacher']} rmse {d['fidelity_rmse']:.3f} r2 {d['fidelity_r2']:.3f}")
+    print("(* selected, p Pareto front on r2 vs "
+          f"{args.latency_metric}{'' if args.latency_budget_ms is None else f', budget {args.latency_budget_ms} ms'})")
+    if not any(meta["selected"] for meta in registry):
+        print("No model fits the latency budget; nothing selected", file=sys.stderr)
+    print("\n" + "  ".join(f"{k} {v:.2f}s" for k, v in timings.items()))
+    print(f"Wrote {len(results)} model(s) and registry.json to {args.out}")
+    selected = next((meta for meta in registry if meta["selected"]), None)
+    if selected is not None:
+        print(f"Current bundle: {selected['model_name']} ({selected['bundle']})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())